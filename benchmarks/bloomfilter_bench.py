@@ -0,0 +1,144 @@
+"""
+Benchmark speed and accuracy of the bloom filter configurations.
+
+Usage:
+
+    python -m benchmarks.bloomfilter_bench --count 100000 --batch-size 100
+
+Each configuration inserts count synthetic request fingerprints, looks them up again, then looks
+up a held-out set of the same size that was never inserted, the positives of which give the
+measured false positive rate. Inserts and lookups run one fingerprint per call (single) and by
+add_many/contains_many batches (batch). The filters run against an in-process redis stand-in
+which counts round trips, or a real redis with --redis-url.
+"""
+import argparse
+import sys
+import time
+from hashlib import sha1
+
+from benchmarks.redis_standin import StandinRedis
+from utils.bloomfilter import (
+    GenerationalBloomFilter,
+    LocalBloomFilter,
+    RedisBloomFilter,
+    ScalableRedisBloomFilter,
+    TieredBloomFilter,
+)
+from utils.hashring import HashRing
+
+
+def fingerprints(prefix, count):
+    return [sha1(('http://%s%d.example.com/page/%d' % (prefix, i % 997, i)).encode('utf-8')).hexdigest()
+            for i in range(count)]
+
+
+def build(name, servers, key, count, error_rate):
+    """Returns filter of configuration name."""
+    server = servers[0]
+    if name == 'legacy':
+        return RedisBloomFilter(server, key)
+    if name == 'capacity':
+        return RedisBloomFilter.from_capacity(server, key, count, error_rate)
+    if name == 'blocks':
+        return RedisBloomFilter.from_capacity(server, key, count, error_rate, block_num=16)
+    if name == 'sharded':
+        ring = HashRing(dict(('node%d' % i, s) for i, s in enumerate(servers)))
+        return RedisBloomFilter.from_capacity(server, key, count, error_rate, block_num=16, ring=ring)
+    if name == 'scalable':
+        return ScalableRedisBloomFilter(server, key, max(1, count // 8), error_rate)
+    if name == 'generational':
+        return GenerationalBloomFilter.from_capacity(server, key, 86400, 7, count, error_rate)
+    if name == 'tiered':
+        return TieredBloomFilter(LocalBloomFilter.from_capacity(count, error_rate),
+                                 RedisBloomFilter.from_capacity(server, key, count, error_rate))
+    if name == 'local':
+        return LocalBloomFilter.from_capacity(count, error_rate)
+    raise ValueError("unknown configuration: %s" % name)
+
+
+CONFIGS = ['legacy', 'capacity', 'blocks', 'sharded', 'scalable', 'generational', 'tiered', 'local']
+
+
+def local_memory(bloomfilter):
+    if isinstance(bloomfilter, LocalBloomFilter):
+        return len(bloomfilter.bits)
+    if isinstance(bloomfilter, TieredBloomFilter):
+        return len(bloomfilter.local.bits)
+    return 0
+
+
+def run(name, mode, servers, count, batch_size, error_rate):
+    key = 'bench:%s:%s' % (name, mode)
+    bloomfilter = build(name, servers, key, count, error_rate)
+    bloomfilter.clear()
+    inserted = fingerprints('in', count)
+    held_out = fingerprints('out', count)
+
+    def round_trips():
+        return sum(getattr(server, 'round_trips', 0) for server in servers)
+
+    def timed(method, method_many, data_list):
+        start_trips = round_trips()
+        start = time.time()
+        if mode == 'single':
+            results = [method(data) for data in data_list]
+        else:
+            results = []
+            for i in range(0, len(data_list), batch_size):
+                results.extend(method_many(data_list[i:i + batch_size]))
+        return results, time.time() - start, round_trips() - start_trips
+
+    _, insert_time, insert_trips = timed(bloomfilter.add, bloomfilter.add_many, inserted)
+    found, lookup_time, lookup_trips = timed(bloomfilter.is_contains, bloomfilter.contains_many, inserted)
+    false_positives, _, _ = timed(bloomfilter.is_contains, bloomfilter.contains_many, held_out)
+
+    memory = local_memory(bloomfilter) + sum(server.memory() for server in servers
+                                             if isinstance(server, StandinRedis))
+    if not all(found):
+        raise AssertionError("%s lost %d inserted fingerprints" % (name, count - sum(found)))
+    result = {
+        'config': name,
+        'mode': mode,
+        'inserts/s': count / max(insert_time, 1e-9),
+        'lookups/s': count / max(lookup_time, 1e-9),
+        'rt/insert': float(insert_trips) / count,
+        'rt/lookup': float(lookup_trips) / count,
+        'memory KB': memory / 1024.0,
+        'fp rate': float(sum(false_positives)) / count,
+    }
+    bloomfilter.clear()
+    bloomfilter.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bloom filter configurations.")
+    parser.add_argument('--count', type=int, default=100000, help="fingerprints inserted and held out")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.001)
+    parser.add_argument('--configs', default=','.join(CONFIGS), help="comma separated, of %s" % CONFIGS)
+    parser.add_argument('--modes', default='single,batch')
+    parser.add_argument('--redis-url', action='append',
+                        help="run against real redis instead of the stand-in, repeat for sharded nodes")
+    args = parser.parse_args(argv)
+
+    if args.redis_url:
+        import redis
+        servers = [redis.StrictRedis.from_url(url) for url in args.redis_url]
+    else:
+        servers = [StandinRedis() for _ in range(3)]
+
+    columns = ['config', 'mode', 'inserts/s', 'lookups/s', 'rt/insert', 'rt/lookup', 'memory KB', 'fp rate']
+    print(' '.join('%12s' % column for column in columns))
+    for name in args.configs.split(','):
+        for mode in args.modes.split(','):
+            result = run(name, mode, servers, args.count, args.batch_size, args.error_rate)
+            print('%12s %12s %12.0f %12.0f %12.3f %12.3f %12.0f %12.5f' % tuple(result[c] for c in columns))
+            for server in servers:
+                if isinstance(server, StandinRedis):
+                    server.data.clear()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Benchmark the CPU and memory trade-off of compressing queued requests.
+
+Usage:
+
+    python -m benchmarks.compression_bench --count 20000
+    python -m benchmarks.compression_bench --serializers compactcodec --save-dict requests.dict
+    python -m benchmarks.compression_bench --redis-url redis://localhost:6379 --key myspider:requests \\
+        --save-dict requests.dict
+
+The requests are the serializer benchmark ones plus a share with a big meta and POST body, or
+the payloads sampled from a live queue with --redis-url and --key. The first --train payloads
+train the preset dictionary, the others are measured with each serializer, compressed without
+and with the dictionary at each threshold. --save-dict writes the dictionary for the
+SCHEDULER_COMPRESSION_DICT setting.
+"""
+import argparse
+import sys
+import time
+
+from scrapy.http import FormRequest
+from scrapy.utils.reqser import request_to_dict
+
+from benchmarks.serializer_bench import BenchSpider, requests
+from scrapy_redis import compactcodec, picklecompat
+from scrapy_redis.compression import CompressedSerializer, train_dictionary
+
+
+def big_requests(spider, count):
+    for i, request in enumerate(requests(spider, count)):
+        if i % 4:
+            yield request
+        elif i % 8:
+            listing = [{'title': 'Item %d of listing %d' % (j, i), 'price': '%d.99' % (j * 7 % 300),
+                        'url': 'http://www.site%d.example.com/item/%d.html' % (i % 97, i * 40 + j)}
+                       for j in range(20)]
+            yield request.replace(meta=dict(request.meta, listing=listing))
+        else:
+            body = '&'.join('field_%d=value+%d+of+form+%d' % (j, j * i % 1000, i) for j in range(60))
+            yield FormRequest('http://www.site%d.example.com/search' % (i % 97), body=body,
+                              method='POST', callback=spider.parse_list,
+                              headers={'Content-Type': 'application/x-www-form-urlencoded'})
+
+
+def sample_queue(url, key, count):
+    import redis
+    server = redis.StrictRedis.from_url(url)
+    if server.type(key) == b'zset':
+        return server.zrange(key, 0, count - 1)
+    return server.lrange(key, 0, count - 1)
+
+
+class Raw(object):
+    """Serializer of the payloads sampled from redis."""
+
+    loads = dumps = staticmethod(lambda s: s)
+
+
+def run(name, serializer, objs):
+    start = time.time()
+    payloads = [serializer.dumps(obj) for obj in objs]
+    encode_time = time.time() - start
+    start = time.time()
+    for payload in payloads:
+        serializer.loads(payload)
+    decode_time = time.time() - start
+    size = float(sum(len(payload) for payload in payloads)) / len(payloads)
+    return {
+        'config': name,
+        'bytes/req': size,
+        'us/encode': encode_time * 1e6 / len(objs),
+        'us/decode': decode_time * 1e6 / len(objs),
+        'MB/1M req': size * 1e6 / (1 << 20),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compression of queued requests.")
+    parser.add_argument('--count', type=int, default=20000, help="requests, with the training ones")
+    parser.add_argument('--train', type=int, default=1000, help="requests used to train the dictionary")
+    parser.add_argument('--thresholds', default='0,256,512,1024')
+    parser.add_argument('--level', type=int, default=6)
+    parser.add_argument('--dict-size', type=int, default=16384)
+    parser.add_argument('--redis-url', help="sample the payloads of a live queue")
+    parser.add_argument('--key', help="queue key sampled with --redis-url")
+    parser.add_argument('--serializers', default='pickle,compactcodec')
+    parser.add_argument('--save-dict', help="write the dictionary of the last serializer to this path")
+    args = parser.parse_args(argv)
+
+    if args.redis_url:
+        serializers = [('raw', Raw)]
+        objs = sample_queue(args.redis_url, args.key, args.count)
+    else:
+        modules = {'pickle': picklecompat, 'compactcodec': compactcodec}
+        serializers = [(name, modules[name]) for name in args.serializers.split(',')]
+        spider = BenchSpider()
+        objs = [request_to_dict(request, spider) for request in big_requests(spider, args.count)]
+    train, objs = objs[:args.train], objs[args.train:]
+
+    columns = ['config', 'bytes/req', 'us/encode', 'us/decode', 'MB/1M req']
+    print('%24s' % columns[0] + ''.join(' %12s' % column for column in columns[1:]))
+    for name, serializer in serializers:
+        start = time.time()
+        zdict = train_dictionary([serializer.dumps(obj) for obj in train], size=args.dict_size)
+        print("%s dictionary: %d bytes trained in %.2fs" % (name, len(zdict), time.time() - start))
+        if args.save_dict:
+            with open(args.save_dict, 'wb') as f:
+                f.write(zdict)
+        configs = [(name, serializer)]
+        for threshold in args.thresholds.split(','):
+            configs.append(('%s+zlib>=%s' % (name, threshold),
+                            CompressedSerializer(serializer, int(threshold), args.level)))
+            configs.append(('%s+dict>=%s' % (name, threshold),
+                            CompressedSerializer(serializer, int(threshold), args.level, zdict)))
+        for config, configured in configs:
+            result = run(config, configured, objs)
+            print('%24s %12.1f %12.1f %12.1f %12.1f' % tuple(result[c] for c in columns))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
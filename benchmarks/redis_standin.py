@@ -0,0 +1,142 @@
+"""
+In-process stand-in for the redis commands used by the bloom filters, so the benchmarks run
+without a redis server. Every command sent directly and every pipeline execute() counts as one
+round trip.
+"""
+import fnmatch
+
+from utils.bloomfilter import RedisBloomFilter
+
+
+class StandinPipeline(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.server, '_' + name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def multi(self):
+        pass
+
+    def execute(self):
+        self.server.round_trips += 1
+        commands, self.commands = self.commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+
+class StandinRedis(object):
+    """Subset of ``redis.StrictRedis`` keeping the data in local dicts."""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def __getattr__(self, name):
+        method = getattr(type(self), '_' + name, None)
+        if method is None:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            self.round_trips += 1
+            return method(self, *args, **kwargs)
+        return call
+
+    def pipeline(self, transaction=True):
+        return StandinPipeline(self)
+
+    def register_script(self, script):
+        """Returns the local equivalent of a known Lua script, called in one round trip."""
+        scripts = {RedisBloomFilter.add_counted_script: self._add_counted}
+        if script not in scripts:
+            raise NotImplementedError("script not emulated by the stand-in")
+        method = scripts[script]
+
+        def call(keys=(), args=()):
+            self.round_trips += 1
+            return method(keys, args)
+        return call
+
+    def memory(self):
+        """Returns bytes used by the bitmaps."""
+        return sum(len(value) for value in self.data.values() if isinstance(value, bytearray))
+
+    def scan_iter(self, match='*'):
+        self.round_trips += 1
+        return iter([key for key in self.data if fnmatch.fnmatchcase(key, match)])
+
+    def _bits(self, key, size):
+        value = self.data.setdefault(key, bytearray())
+        if len(value) < size:
+            value.extend(bytes(size - len(value)))
+        return value
+
+    def _setbit(self, key, offset, bit):
+        value = self._bits(key, (offset >> 3) + 1)
+        mask = 0x80 >> (offset & 7)
+        previous = 1 if value[offset >> 3] & mask else 0
+        if bit:
+            value[offset >> 3] |= mask
+        else:
+            value[offset >> 3] &= ~mask & 0xff
+        return previous
+
+    def _getbit(self, key, offset):
+        value = self.data.get(key)
+        if value is None or len(value) <= offset >> 3:
+            return 0
+        return 1 if value[offset >> 3] & (0x80 >> (offset & 7)) else 0
+
+    def _strlen(self, key):
+        return len(self.data.get(key, b''))
+
+    def _getrange(self, key, start, end):
+        return bytes(self.data.get(key, bytearray())[start:end + 1])
+
+    def _setrange(self, key, offset, value):
+        self._bits(key, offset + len(value))[offset:offset + len(value)] = value
+        return len(self.data[key])
+
+    def _delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def _expireat(self, key, when):
+        return key in self.data
+
+    def _hsetnx(self, key, field, value):
+        fields = self.data.setdefault(key, {})
+        if str(field) in fields:
+            return 0
+        fields[str(field)] = value
+        return 1
+
+    def _hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    def _hget(self, key, field):
+        return self.data.get(key, {}).get(str(field))
+
+    def _add_counted(self, keys, args):
+        hash_num = int(args[0])
+        bits = []
+        added = 0
+        for i in range(2, len(args), hash_num):
+            exist = 1
+            for offset in args[i:i + hash_num]:
+                bit = self._setbit(keys[0], int(offset), 1)
+                bits.append(bit)
+                exist &= bit
+            added += 1 - exist
+        bits.append(self._hincrby(keys[1], args[1], added))
+        return bits
+
+    def _hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        fields[str(field)] = int(fields.get(str(field), 0)) + amount
+        return fields[str(field)]
@@ -0,0 +1,112 @@
+"""
+Benchmark size and speed of the scheduler queue serializers.
+
+Usage:
+
+    python -m benchmarks.serializer_bench --count 20000
+
+Encodes count realistic request dicts, as the queues store them, with each serializer and reports
+the mean bytes per request, encodes and decodes per second, and the redis memory the payloads of
+one million requests would take. json cannot encode the bytes in the dicts, it is only shown for
+size with the bytes decoded as latin-1.
+"""
+import argparse
+import json
+import sys
+import time
+
+from scrapy import Request, Spider
+from scrapy.http import FormRequest
+from scrapy.utils.reqser import request_to_dict
+
+from scrapy_redis import compactcodec, picklecompat
+
+
+class BenchSpider(Spider):
+    name = 'bench'
+
+    def parse_list(self, response):
+        pass
+
+    def parse_item(self, response):
+        pass
+
+
+def requests(spider, count):
+    for i in range(count):
+        site = 'http://www.site%d.example.com' % (i % 97)
+        referer = '%s/list/%d?page=%d' % (site, i % 13, i % 50)
+        if i % 10 == 0:
+            yield FormRequest('%s/search' % site, formdata={'q': 'item %d' % i, 'page': str(i % 50)},
+                              callback=spider.parse_list, headers={'Referer': referer})
+        else:
+            yield Request('%s/item/%d.html?ref=list&utm_source=feed' % (site, i), callback=spider.parse_item,
+                          headers={'Referer': referer}, priority=-(i % 3),
+                          meta={'depth': i % 5, 'link_text': 'Item number %d' % i,
+                                '_fingerprint': '%08x%032x' % (i, i)})
+
+
+def _text(obj):
+    if isinstance(obj, bytes):
+        return obj.decode('latin-1')
+    if isinstance(obj, dict):
+        return dict((_text(key), _text(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_text(value) for value in obj]
+    return obj
+
+
+def json_dumps(obj):
+    return json.dumps(_text(obj)).encode('utf-8')
+
+
+SERIALIZERS = [
+    ('pickle', picklecompat.dumps, picklecompat.loads),
+    ('json', json_dumps, None),
+    ('compactcodec', compactcodec.dumps, compactcodec.loads),
+]
+
+
+def run(name, dumps, loads, dicts):
+    start = time.time()
+    payloads = [dumps(obj) for obj in dicts]
+    encode_time = time.time() - start
+    decode_time = None
+    if loads is not None:
+        start = time.time()
+        for payload in payloads:
+            loads(payload)
+        decode_time = time.time() - start
+    size = float(sum(len(payload) for payload in payloads)) / len(payloads)
+    return {
+        'serializer': name,
+        'bytes/req': size,
+        'encodes/s': len(dicts) / max(encode_time, 1e-9),
+        'decodes/s': len(dicts) / max(decode_time, 1e-9) if decode_time is not None else float('nan'),
+        'MB/1M req': size * 1e6 / (1 << 20),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scheduler queue serializers.")
+    parser.add_argument('--count', type=int, default=20000, help="requests encoded")
+    args = parser.parse_args(argv)
+
+    spider = BenchSpider()
+    dicts = [request_to_dict(request, spider) for request in requests(spider, args.count)]
+
+    columns = ['serializer', 'bytes/req', 'encodes/s', 'decodes/s', 'MB/1M req']
+    print(' '.join('%12s' % column for column in columns))
+    codec = compactcodec.for_spider(spider)
+    # The codec of the queues, storing the callbacks as ids.
+    serializers = SERIALIZERS + [('spidercodec', codec.dumps, codec.loads)]
+    for name, dumps, loads in serializers:
+        result = run(name, dumps, loads, dicts)
+        print('%12s %12.1f %12.0f %12.0f %12.1f' % tuple(result[c] for c in columns))
+    if compactcodec.msgpack is None:
+        print("msgpack is not installed, compactcodec fell back to pickle")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
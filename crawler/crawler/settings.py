@@ -121,18 +121,110 @@ DOWNLOAD_DELAY = 1
 # Ensure all spiders share same duplicates filter through redis.
 DUPEFILTER_CLASS = "scrapy_redis.dupefilter.RFPDupeFilter"
 
+# Fingerprint requests once on a canonical URL, so URLs only differing by
+# query order, fragment, session ids or tracking parameters are duplicates.
+# DUPEFILTER_FINGERPRINTER = "scrapy_redis.fingerprint.RequestFingerprinter"
+# DUPEFILTER_FINGERPRINT_DROP_PARAMS = ['utm_*', 'gclid', 'sessionid', 'jsessionid']
+# DUPEFILTER_FINGERPRINT_KEEP_FRAGMENTS = False
+
+# Resolve the duplicates by batches on a worker thread, off the reactor.
+# DUPEFILTER_CLASS = "scrapy_redis.dupefilter.AsyncRFPDupeFilter"
+# DUPEFILTER_ASYNC_BATCH_SIZE = 100
+# DUPEFILTER_ASYNC_INTERVAL = 0.05
+
 # Enables scheduling storing requests queue in redis.
 SCHEDULER = "scrapy_redis.scheduler.Scheduler"
 
 # Don't cleanup redis queues, allows to pause/resume crawls.
 SCHEDULER_PERSIST = True
 
+# Size the dupefilter bloomfilter for the expected number of requests and the
+# target false positive rate, instead of the fixed 256MB block and 9 hashes.
+# BLOOMFILTER_CAPACITY = 100000000
+# BLOOMFILTER_ERROR_RATE = 0.001
+
+# Grow the bloomfilter by slices as it fills up, BLOOMFILTER_CAPACITY is then
+# the capacity of the first slice.
+# BLOOMFILTER_SCALABLE = False
+
+# Route fingerprints to several blocks and spread the blocks over redis nodes
+# by consistent hashing, so dedup memory and QPS scale with the nodes.
+# BLOOMFILTER_BLOCK_NUM = 32
+# BLOOMFILTER_REDIS_NODES = ['redis://host1:6379', 'redis://host2:6379']
+
+# Only remember fingerprints for the last BLOOMFILTER_GENERATIONS windows of
+# BLOOMFILTER_GENERATION_WINDOW seconds, so pages are recrawled on schedule.
+# Requires BLOOMFILTER_CAPACITY, the capacity of each generation. Not
+# supported with the in-process bloomfilter below.
+# BLOOMFILTER_GENERATION_WINDOW = 86400
+# BLOOMFILTER_GENERATIONS = 7
+
+# Keep an in-process bloomfilter in front of redis, fingerprints already seen
+# by this process are answered locally. BLOOMFILTER_LOCAL_ONLY drops redis
+# from the dupefilter for single node crawls.
+# BLOOMFILTER_LOCAL_CACHE = False
+# BLOOMFILTER_LOCAL_ONLY = False
+# BLOOMFILTER_LOCAL_CAPACITY = 10000000
+# Memory map the in-process bloomfilter to a file so it survives restarts.
+# BLOOMFILTER_LOCAL_PATH = 'bloomfilter.bits'
+
 # Schedule requests using a priority queue. (default)
 # SCHEDULER_QUEUE_CLASS = "scrapy_redis.queue.SpiderPriorityQueue"
 
 # Alternative queues.
 # SCHEDULER_QUEUE_CLASS = "scrapy_redis.queue.SpiderQueue"
 # SCHEDULER_QUEUE_CLASS = "scrapy_redis.queue.SpiderStack"
+# One priority queue per host, popped in turn once DOWNLOAD_DELAY has passed
+# since the last pop of the same host.
+# SCHEDULER_QUEUE_CLASS = "scrapy_redis.queue.HostPriorityQueue"
+
+# Spread the queue over shards, by host, on several redis nodes. Each pop
+# takes the next shard in turn.
+# SCHEDULER_QUEUE_CLASS = "scrapy_redis.queue.ShardedQueue"
+# SCHEDULER_QUEUE_SHARDS = 8
+# SCHEDULER_QUEUE_REDIS_NODES = ['redis://host1:6379', 'redis://host2:6379']
+# SCHEDULER_QUEUE_SHARD_CLASS = "scrapy_redis.queue.HostPriorityQueue"
+
+# Buffer pushed requests and send them to redis together in one round trip,
+# when the buffer is full, older than the time limit (checked by the
+# scheduler at that interval), or before a pop.
+# SCHEDULER_QUEUE_PUSH_BUFFER_SIZE = 100
+# SCHEDULER_QUEUE_PUSH_BUFFER_TIME = 0.1
+
+# Pop this many requests at once from the priority queue with ZPOPMIN
+# (redis >= 5.0), or from as many ready hosts of the host queue, and serve
+# them from a local buffer.
+# SCHEDULER_QUEUE_PREFETCH = 16
+
+# Spill new requests to local segment files while the queue holds more than
+# SCHEDULER_QUEUE_SPILL_LENGTH requests or redis uses more than
+# SCHEDULER_QUEUE_SPILL_MEMORY bytes, and move them back as the queue drains.
+# Each crawler process of the host locks its own subdirectory of the files.
+# SCHEDULER_QUEUE_SPILL_DIR = "/var/tmp/scrapy-redis-spill"
+# SCHEDULER_QUEUE_SPILL_LENGTH = 1000000
+# SCHEDULER_QUEUE_SPILL_MEMORY = 4 * 1024 ** 3
+# SCHEDULER_QUEUE_SPILL_REFILL = 1000
+# SCHEDULER_QUEUE_SPILL_SEGMENT_SIZE = 64 * 1024 ** 2
+
+# Wait longer and longer, up to this many seconds, between two pops of an
+# empty queue when SCHEDULER_IDLE_BEFORE_CLOSE is 0. With SCHEDULER_IDLE_NOTIFY
+# a push of any crawler ends the wait of the others.
+# SCHEDULER_IDLE_BACKOFF_MAX = 30
+# SCHEDULER_IDLE_BACKOFF_MIN = 0.5
+# SCHEDULER_IDLE_NOTIFY = True
+
+# Seconds between two reads of the queue length from redis by the idle check,
+# the length is counted locally in between.
+# SCHEDULER_LENGTH_REFRESH_INTERVAL = 1
+
+# Keep popped requests leased in redis until their response is processed, and
+# requeue the ones not acknowledged in time, like the requests of a crashed
+# crawler. Needs the lease middleware.
+# SCHEDULER_LEASE_TIMEOUT = 600
+# SCHEDULER_LEASE_SWEEP_INTERVAL = 5
+# SCHEDULER_LEASE_MAX_REQUEUES = 3
+# SPIDER_MIDDLEWARES = {'scrapy_redis.lease.LeaseMiddleware': 0}
+# DOWNLOADER_MIDDLEWARES = {'scrapy_redis.lease.LeaseMiddleware': 0}
 
 # Default requests serializer is pickle, but it can be changed to any module
 # with loads and dumps functions. Note that pickle is not compatible between
@@ -142,9 +234,20 @@ SCHEDULER_PERSIST = True
 # work by default. In python 2.x there is no such issue and you can use
 # 'json' or 'msgpack' as serializers.
 # SCHEDULER_SERIALIZER = "scrapy_redis.picklecompat"
+# Smaller requests in redis, encoded with msgpack when it is installed and
+# still able to read requests queued by picklecompat.
+# SCHEDULER_SERIALIZER = "scrapy_redis.compactcodec"
+
+# Compress serialized requests of at least this many bytes with zlib, like
+# the ones with a big meta or POST body. Requests queued before are still read.
+# SCHEDULER_COMPRESSION_THRESHOLD = 512
+# SCHEDULER_COMPRESSION_LEVEL = 6
+# Preset dictionary trained from sample requests, see
+# python -m benchmarks.compression_bench --save-dict
+# SCHEDULER_COMPRESSION_DICT = "requests.dict"
 
 # Max idle time to prevent the spider from being closed when distributed crawling.
-# This only works if queue class is SpiderQueue or SpiderStack,
+# The queue waits for a request with BRPOP, BLPOP or BZPOPMIN,
 # and may also block the same time when your spider start at the first time (because the queue is empty).
 # SCHEDULER_IDLE_BEFORE_CLOSE = 10
 
@@ -194,6 +297,31 @@ REDIS_PORT = 6379
 # processing does not matter.
 # REDIS_START_URLS_AS_SET = False
 
+# If True, it pops the highest scores of a sorted set, filled with ``ZADD``,
+# and the score of a url becomes the priority of its request, so important
+# seeds are crawled before the long tail (see utils/seedloader.py --type zset).
+# REDIS_START_URLS_AS_ZSET = False
+
+# Start urls are fetched in batches of one round trip. Above the batch size
+# (CONCURRENT_REQUESTS by default), the batch size is tuned up to this maximum so
+# that a batch lasts REDIS_START_URLS_BATCH_INTERVAL seconds.
+# REDIS_START_URLS_BATCH_SIZE_MAX = 1000
+# REDIS_START_URLS_BATCH_INTERVAL = 5
+
+# Check every this many seconds whether the crawl is running out of requests,
+# that is the scheduler is empty and less than REDIS_START_URLS_TOPUP_RATIO of
+# the download slots are busy, and schedule start urls before the spider idles.
+# REDIS_START_URLS_TOPUP_INTERVAL = 1
+# REDIS_START_URLS_TOPUP_RATIO = 0.5
+
+# Wait longer and longer, up to this many seconds, between two reads of an
+# empty start urls key, and read it again as soon as a message is published on
+# '<key>:notify' or redis sends a keyspace notification for the key (enabled
+# with notify-keyspace-events).
+# REDIS_START_URLS_BACKOFF_MAX = 30
+# REDIS_START_URLS_BACKOFF_MIN = 0.5
+# REDIS_START_URLS_NOTIFY = True
+
 # Default start urls key for RedisSpider and RedisCrawlSpider.
 REDIS_START_URLS_KEY = '%(name)s:start_urls'
 
@@ -2,6 +2,7 @@
 from .connection import (  # NOQA
     get_redis,
     get_redis_from_settings,
+    get_redis_nodes_from_settings,
 )
 
 
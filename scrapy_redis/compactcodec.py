@@ -0,0 +1,154 @@
+"""A compact serializer module for requests queued in redis.
+
+The ``request_to_dict`` output is packed as a list: a bitmask of the fields
+that differ from their default, then only those values in a fixed order, so
+neither default values nor field names are stored. The list is encoded with
+msgpack when it is installed, or pickle otherwise or when a value (like an
+object in meta) is not supported by msgpack. The first byte tells loads which
+one was used, and payloads written by ``scrapy_redis.picklecompat`` are still
+accepted, so a queue can switch serializer without being flushed. Values that
+msgpack would not give back as they are, like tuples, also use pickle.
+
+The queues use the codec bound to their spider by ``for_spider``, which
+stores the callback and errback names as a 16 bit id, the crc32 of the name.
+An id is decoded with the methods of the spider, so unlike an index it stays
+valid when other methods are added, and names whose ids collide are stored as
+they are.
+
+Use it by setting ``SCHEDULER_SERIALIZER = "scrapy_redis.compactcodec"``.
+"""
+import zlib
+
+import six
+
+try:
+    import cPickle as pickle  # PY2
+except ImportError:
+    import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Field name and default value, the order is part of the format.
+FIELDS = [
+    ('url', None),
+    ('callback', None),
+    ('errback', None),
+    ('method', 'GET'),
+    ('headers', {}),
+    ('body', b''),
+    ('cookies', {}),
+    ('meta', {}),
+    ('_encoding', 'utf-8'),
+    ('priority', 0),
+    ('dont_filter', False),
+    ('flags', []),
+    ('cb_kwargs', {}),
+    ('_class', None),
+]
+_NAMES = set(name for name, _ in FIELDS)
+_CALLBACKS = ('callback', 'errback')
+
+MSGPACK_FORMAT = b'\x01'
+PICKLE_FORMAT = b'\x02'
+
+
+def callback_id(name):
+    """Returns the id stored for the callback or errback name"""
+    return zlib.crc32(name.encode('utf-8')) & 0xffff
+
+
+def _pack(obj, ids=None):
+    mask = 0
+    values = []
+    for bit, (name, default) in enumerate(FIELDS):
+        value = obj.get(name, default)
+        if value != default:
+            mask |= 1 << bit
+            if ids and name in _CALLBACKS:
+                value = ids.get(value, value)
+            values.append(value)
+    extra = dict((name, value) for name, value in obj.items() if name not in _NAMES)
+    packed = [mask] + values
+    if extra:
+        packed.append(extra)
+    return packed
+
+
+def _unpack(packed, names=None):
+    mask = packed[0]
+    position = 1
+    obj = {}
+    for bit, (name, default) in enumerate(FIELDS):
+        if mask & (1 << bit):
+            obj[name] = packed[position]
+            position += 1
+        elif name != '_class':
+            # Fresh copies, the request keeps the mutable defaults.
+            obj[name] = type(default)() if isinstance(default, (dict, list)) else default
+    if position < len(packed):
+        obj.update(packed[position])
+    for name in _CALLBACKS:
+        if isinstance(obj[name], six.integer_types):
+            if names is None or obj[name] not in names:
+                raise ValueError("unknown %s id %d, decode with the codec of the spider" % (name, obj[name]))
+            obj[name] = names[obj[name]]
+    return obj
+
+
+def _loads(s, names=None):
+    if s[:1] == MSGPACK_FORMAT:
+        if msgpack is None:
+            raise ValueError("msgpack is required to decode this request")
+        packed = msgpack.unpackb(s[1:], raw=False, strict_map_key=False)
+        return _unpack(packed, names)
+    if s[:1] == PICKLE_FORMAT:
+        return _unpack(pickle.loads(s[1:]), names)
+    # Written by picklecompat.
+    return pickle.loads(s)
+
+
+def _dumps(obj, ids=None):
+    packed = _pack(obj, ids)
+    if msgpack is not None:
+        try:
+            # Strict types, so tuples and subclasses fall back to pickle.
+            return MSGPACK_FORMAT + msgpack.packb(packed, use_bin_type=True, strict_types=True)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return PICKLE_FORMAT + pickle.dumps(packed, protocol=-1)
+
+
+def loads(s):
+    return _loads(s)
+
+
+def dumps(obj):
+    return _dumps(obj)
+
+
+class SpiderCodec(object):
+    """Codec storing the callback and errback names of spider as ids."""
+
+    def __init__(self, spider):
+        cls = type(spider)
+        candidates = {}
+        for name in dir(cls):
+            if callable(getattr(cls, name, None)):
+                candidates.setdefault(callback_id(name), []).append(name)
+        self.names = dict((id_, names[0]) for id_, names in candidates.items() if len(names) == 1)
+        self.ids = dict((name, id_) for id_, name in self.names.items())
+
+    def loads(self, s):
+        return _loads(s, self.names)
+
+    def dumps(self, obj):
+        return _dumps(obj, self.ids)
+
+
+def for_spider(spider):
+    """Returns the codec of spider, used by the queues"""
+    return SpiderCodec(spider)
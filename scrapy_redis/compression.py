@@ -0,0 +1,153 @@
+"""Transparent compression of the payloads of any serializer module.
+
+Payloads longer than a threshold are deflated, optionally with a preset
+dictionary trained from sample payloads, and tagged with a header so that
+``loads`` knows how to inflate them. Shorter payloads, and payloads queued
+before compression was enabled, are left to the wrapped serializer as they
+are, which works because no serializer output starts with the header's NUL
+byte.
+
+Enable it by setting ``SCHEDULER_COMPRESSION_THRESHOLD``.
+"""
+import collections
+import struct
+import zlib
+
+from . import defaults, picklecompat
+
+
+MAGIC = b'\x00Z'
+DEFLATE = b'\x00'
+DEFLATE_DICT = b'\x01'
+# adler32 of the dictionary, so a payload is not inflated with another one
+DICT_ID = struct.Struct('>I')
+# raw deflate streams, the redis payload needs no zlib header and trailer
+WBITS = -15
+
+
+def dict_id(zdict):
+    return zlib.adler32(zdict) & 0xffffffff
+
+
+def train_dictionary(samples, size=16384, length=8, min_share=0.05):
+    """Returns a preset dictionary for the payloads like samples.
+
+    Parameters
+    ----------
+    samples : list of bytes
+        Serialized payloads, a few hundred are enough.
+    size : int
+        Maximum dictionary size, deflate can not use more than 32KB.
+    length : int
+        Length of the substrings counted across the samples.
+    min_share : float
+        Share of the samples a substring must appear in to be kept.
+
+    Returns
+    -------
+    bytes
+
+    """
+    samples = [bytes(sample) for sample in samples]
+    frequency = collections.Counter()
+    for sample in samples:
+        frequency.update(set(sample[i:i + length] for i in range(len(sample) - length + 1)))
+    min_count = max(2, int(len(samples) * min_share))
+    # the runs of common substrings of each sample are the common segments
+    segments = collections.Counter()
+    for sample in samples:
+        start = None
+        for i in range(len(sample) - length + 1):
+            common = frequency[sample[i:i + length]] >= min_count
+            if common and start is None:
+                start = i
+            elif not common and start is not None:
+                segments[sample[start:i + length - 1]] += 1
+                start = None
+        if start is not None:
+            segments[sample[start:]] += 1
+    zdict = b''
+    # most useful last, deflate encodes the closest matches in less bits
+    for segment, count in sorted(segments.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if len(zdict) + len(segment) > size:
+            continue
+        if segment not in zdict:
+            zdict = segment + zdict
+    return zdict
+
+
+class CompressedSerializer(object):
+    """Serializer compressing the payloads of another serializer."""
+
+    def __init__(self, serializer=None, threshold=1024, level=defaults.SCHEDULER_COMPRESSION_LEVEL, zdict=None):
+        """Initialize the compressed serializer.
+
+        Parameters
+        ----------
+        serializer : object
+            Serializer object with ``loads`` and ``dumps`` methods, pickle
+            by default.
+        threshold : int
+            Payloads shorter than this many bytes are not compressed.
+        level : int
+            zlib compression level, 1 (fastest) to 9 (smallest).
+        zdict : bytes
+            Preset dictionary, see ``train_dictionary``. Python 3 only.
+
+        """
+        self.serializer = serializer or picklecompat
+        self.threshold = threshold
+        self.level = level
+        self.zdict = zdict or None
+        if self.zdict is not None:
+            self.header = MAGIC + DEFLATE_DICT + DICT_ID.pack(dict_id(self.zdict))
+        else:
+            self.header = MAGIC + DEFLATE
+
+    @classmethod
+    def from_settings(cls, settings, serializer=None):
+        zdict = None
+        path = settings.get('SCHEDULER_COMPRESSION_DICT')
+        if path:
+            with open(path, 'rb') as f:
+                zdict = f.read()
+        return cls(serializer=serializer,
+                   threshold=settings.getint('SCHEDULER_COMPRESSION_THRESHOLD'),
+                   level=settings.getint('SCHEDULER_COMPRESSION_LEVEL', defaults.SCHEDULER_COMPRESSION_LEVEL),
+                   zdict=zdict)
+
+    def for_spider(self, spider):
+        """Returns the serializer for spider when the wrapped one has one"""
+        if not hasattr(self.serializer, 'for_spider'):
+            return self
+        return CompressedSerializer(self.serializer.for_spider(spider), self.threshold, self.level, self.zdict)
+
+    def _compressobj(self):
+        if self.zdict is not None:
+            return zlib.compressobj(self.level, zlib.DEFLATED, WBITS, 9, zlib.Z_DEFAULT_STRATEGY, self.zdict)
+        return zlib.compressobj(self.level, zlib.DEFLATED, WBITS)
+
+    def dumps(self, obj):
+        s = self.serializer.dumps(obj)
+        if len(s) < self.threshold:
+            return s
+        compressor = self._compressobj()
+        compressed = self.header + compressor.compress(s) + compressor.flush()
+        # Incompressible payloads are kept as they are.
+        return compressed if len(compressed) < len(s) else s
+
+    def loads(self, s):
+        if s[:2] != MAGIC:
+            return self.serializer.loads(s)
+        method = s[2:3]
+        if method == DEFLATE:
+            decompressor = zlib.decompressobj(WBITS)
+            data = s[3:]
+        elif method == DEFLATE_DICT:
+            if self.zdict is None or DICT_ID.unpack(s[3:7])[0] != dict_id(self.zdict):
+                raise ValueError("request was compressed with another dictionary")
+            decompressor = zlib.decompressobj(WBITS, self.zdict)
+            data = s[7:]
+        else:
+            raise ValueError("unknown compression method: %r" % method)
+        return self.serializer.loads(decompressor.decompress(data) + decompressor.flush())
@@ -64,6 +64,35 @@ def get_redis_from_settings(settings):
 from_settings = get_redis_from_settings
 
 
+def get_redis_nodes_from_settings(settings, setting_name):
+    """Returns redis client instances for the node urls of a list setting.
+
+    Each url is connected with the same ``REDIS_PARAMS`` as the main client.
+
+    Parameters
+    ----------
+    settings : Settings
+        A scrapy settings object.
+    setting_name : str
+        Name of the list setting holding the redis urls.
+
+    Returns
+    -------
+    dict
+        Node url to redis client instance, empty if the setting is not set.
+
+    """
+    params = defaults.REDIS_PARAMS.copy()
+    params.update(settings.getdict('REDIS_PARAMS'))
+    if isinstance(params.get('redis_cls'), six.string_types):
+        params['redis_cls'] = load_object(params['redis_cls'])
+
+    nodes = {}
+    for url in settings.getlist(setting_name):
+        nodes[url] = get_redis(url=url, **params)
+    return nodes
+
+
 def get_redis(**kwargs):
     """Returns a redis client instance.
 
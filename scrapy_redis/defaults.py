@@ -18,8 +18,43 @@ REDIS_PARAMS = {
 
 SCHEDULER_QUEUE_KEY = '%(spider)s:requests'
 SCHEDULER_QUEUE_CLASS = 'scrapy_redis.queue.PriorityQueue'
+SCHEDULER_QUEUE_PUSH_BUFFER_TIME = 0.1
+SCHEDULER_QUEUE_SHARD_CLASS = 'scrapy_redis.queue.PriorityQueue'
+SCHEDULER_QUEUE_SPILL_REFILL = 1000
+SCHEDULER_QUEUE_SPILL_SEGMENT_SIZE = 64 << 20
+SCHEDULER_COMPRESSION_LEVEL = 6
+SCHEDULER_IDLE_BACKOFF_MIN = 0.5
+SCHEDULER_LENGTH_REFRESH_INTERVAL = 1.0
+SCHEDULER_LEASE_SWEEP_INTERVAL = 5.0
+SCHEDULER_LEASE_MAX_REQUEUES = 3
 SCHEDULER_DUPEFILTER_KEY = '%(spider)s:dupefilter'
 SCHEDULER_DUPEFILTER_CLASS = 'scrapy_redis.dupefilter.RFPDupeFilter'
 
+# Without a fingerprinter scrapy's request_fingerprint is used.
+DUPEFILTER_FINGERPRINTER = None
+DUPEFILTER_FINGERPRINT_DROP_PARAMS = [
+    'utm_*', 'gclid', 'fbclid', 'yclid', 'mc_cid', 'mc_eid', '_ga',
+    'sid', 'sessionid', 'session_id', 'jsessionid', 'phpsessid', 'aspsessionid*',
+]
+
+DUPEFILTER_ASYNC_BATCH_SIZE = 100
+DUPEFILTER_ASYNC_INTERVAL = 0.05
+
+# Without a capacity the bloomfilter keeps the fixed 256MB block and 9 hashes.
+BLOOMFILTER_CAPACITY = None
+BLOOMFILTER_ERROR_RATE = 0.001
+BLOOMFILTER_SCALABLE = False
+BLOOMFILTER_BLOCK_NUM = 1
+# Without a window fingerprints are remembered forever.
+BLOOMFILTER_GENERATION_WINDOW = None
+BLOOMFILTER_GENERATIONS = 7
+BLOOMFILTER_LOCAL_CACHE = False
+BLOOMFILTER_LOCAL_ONLY = False
+BLOOMFILTER_LOCAL_CAPACITY = 10000000
+
 START_URLS_KEY = '%(name)s:start_urls'
 START_URLS_AS_SET = False
+START_URLS_AS_ZSET = False
+START_URLS_BACKOFF_MIN = 0.5
+START_URLS_BATCH_INTERVAL = 5.0
+START_URLS_TOPUP_RATIO = 0.5
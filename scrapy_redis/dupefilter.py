@@ -2,14 +2,128 @@ import logging
 import time
 
 from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.misc import load_object
 from scrapy.utils.request import request_fingerprint
-from utils.bloomfilter import RedisBloomFilter
+from twisted.internet import defer, task, threads
+from utils.bloomfilter import (
+    GenerationalBloomFilter,
+    LocalBloomFilter,
+    RedisBloomFilter,
+    ScalableRedisBloomFilter,
+    TieredBloomFilter,
+)
+from utils.hashring import HashRing
 from . import defaults
-from .connection import get_redis_from_settings
+from .connection import get_redis_from_settings, get_redis_nodes_from_settings
 
 logger = logging.getLogger(__name__)
 
 
+def _passthrough(result, func, *args):
+    """Deferred callback calling func without changing the result."""
+    func(*args)
+    return result
+
+
+def get_bloomfilter_from_settings(server, key, settings):
+    """Returns a bloomfilter instance from given Scrapy settings object.
+
+    Parameters
+    ----------
+    server : redis.StrictRedis
+        The redis server instance.
+    key : str
+        Redis key prefix of the bloomfilter blocks.
+    settings : scrapy.settings.Settings
+        A scrapy settings object. See the supported settings below.
+
+    Returns
+    -------
+    utils.bloomfilter.BaseBloomFilter
+
+    Other Parameters
+    ----------------
+    BLOOMFILTER_CAPACITY : int, optional
+        Expected number of fingerprints. When set, the bit size and number of
+        hashes are computed from it, otherwise a fixed 256MB block is used.
+    BLOOMFILTER_ERROR_RATE : float, optional
+        Target false positive rate at capacity. Default is 0.001.
+    BLOOMFILTER_BLOCK_NUM : int, optional
+        Number of blocks the fingerprints are routed to. Default is 1.
+    BLOOMFILTER_REDIS_NODES : list, optional
+        Redis urls to spread the blocks over by consistent hashing, instead of
+        keeping them all on ``server``. Use several blocks per node so the
+        blocks balance well, and keep the block number when nodes change.
+    BLOOMFILTER_SCALABLE : bool, optional
+        Grow the filter by slices as it fills up, ``BLOOMFILTER_CAPACITY`` is
+        then the capacity of the first slice (default 1000000).
+    BLOOMFILTER_GENERATION_WINDOW : int, optional
+        Seconds covered by each generation of the filter. When set, a request
+        is only a duplicate if it was seen in the last
+        ``BLOOMFILTER_GENERATIONS`` windows, so it is crawled again afterwards.
+        ``BLOOMFILTER_CAPACITY``, required then, is the capacity of each
+        generation. Not supported with the in-process bloomfilter.
+    BLOOMFILTER_GENERATIONS : int, optional
+        Number of windows a request is remembered. Default is 7.
+    BLOOMFILTER_LOCAL_CACHE : bool, optional
+        Answer the fingerprints already seen by this process from an in-process
+        bloomfilter and only ask redis about the possibly new ones.
+    BLOOMFILTER_LOCAL_ONLY : bool, optional
+        Use only the in-process bloomfilter, for single node crawls that need
+        no redis at all.
+    BLOOMFILTER_LOCAL_CAPACITY : int, optional
+        Capacity of the in-process bloomfilter. Defaults to
+        ``BLOOMFILTER_CAPACITY`` or 10000000.
+    BLOOMFILTER_LOCAL_PATH : str, optional
+        File to memory map the in-process bloomfilter, so it survives restarts.
+
+    """
+    capacity = settings.get('BLOOMFILTER_CAPACITY', defaults.BLOOMFILTER_CAPACITY)
+    error_rate = settings.getfloat('BLOOMFILTER_ERROR_RATE', defaults.BLOOMFILTER_ERROR_RATE)
+    block_num = settings.getint('BLOOMFILTER_BLOCK_NUM', defaults.BLOOMFILTER_BLOCK_NUM)
+    nodes = get_redis_nodes_from_settings(settings, 'BLOOMFILTER_REDIS_NODES')
+    ring = HashRing(nodes) if nodes else None
+
+    window = settings.getint('BLOOMFILTER_GENERATION_WINDOW', defaults.BLOOMFILTER_GENERATION_WINDOW or 0)
+    generations = settings.getint('BLOOMFILTER_GENERATIONS', defaults.BLOOMFILTER_GENERATIONS)
+
+    if window and not capacity:
+        # Each generation would be a fixed 256MB block, 1.75GB of redis with
+        # the default 7 generations.
+        raise ValueError("BLOOMFILTER_GENERATION_WINDOW requires BLOOMFILTER_CAPACITY")
+
+    local = None
+    if (settings.getbool('BLOOMFILTER_LOCAL_CACHE', defaults.BLOOMFILTER_LOCAL_CACHE)
+            or settings.getbool('BLOOMFILTER_LOCAL_ONLY', defaults.BLOOMFILTER_LOCAL_ONLY)):
+        if window:
+            # The in-process bloomfilter never forgets, requests would never
+            # be crawled again.
+            raise ValueError("BLOOMFILTER_GENERATION_WINDOW can not be used with "
+                             "BLOOMFILTER_LOCAL_CACHE or BLOOMFILTER_LOCAL_ONLY")
+        local_capacity = settings.getint('BLOOMFILTER_LOCAL_CAPACITY',
+                                         capacity or defaults.BLOOMFILTER_LOCAL_CAPACITY)
+        local = LocalBloomFilter.from_capacity(local_capacity, error_rate,
+                                               path=settings.get('BLOOMFILTER_LOCAL_PATH'))
+        if settings.getbool('BLOOMFILTER_LOCAL_ONLY', defaults.BLOOMFILTER_LOCAL_ONLY):
+            return local
+
+    if window:
+        remote = GenerationalBloomFilter.from_capacity(server, key, window, generations, int(capacity),
+                                                       error_rate, block_num=block_num, ring=ring)
+    elif settings.getbool('BLOOMFILTER_SCALABLE', defaults.BLOOMFILTER_SCALABLE):
+        remote = ScalableRedisBloomFilter(server, key, int(capacity or 1000000), error_rate,
+                                          block_num=block_num, ring=ring)
+    elif capacity:
+        remote = RedisBloomFilter.from_capacity(server, key, int(capacity), error_rate,
+                                                block_num=block_num, ring=ring)
+    else:
+        remote = RedisBloomFilter(server, key, block_num=block_num, ring=ring)
+
+    if local is not None:
+        return TieredBloomFilter(local, remote)
+    return remote
+
+
 # TODO: Rename class to RedisDupeFilter.
 class RFPDupeFilter(BaseDupeFilter):
     """Redis-based request duplicates filter.
@@ -20,7 +134,7 @@ class RFPDupeFilter(BaseDupeFilter):
 
     logger = logger
 
-    def __init__(self, server, key, debug=False):
+    def __init__(self, server, key, debug=False, bloomfilter=None, fingerprinter=None):
         """Initialize the duplicates filter.
 
         Parameters
@@ -31,13 +145,23 @@ class RFPDupeFilter(BaseDupeFilter):
             Redis key Where to store fingerprints.
         debug : bool, optional
             Whether to log filtered requests.
+        bloomfilter : utils.bloomfilter.BaseBloomFilter, optional
+            Bloomfilter storing the fingerprints. Defaults to a
+            ``RedisBloomFilter`` on ``key``.
+        fingerprinter : object, optional
+            Object with a ``fingerprint(request)`` method, like
+            ``scrapy_redis.fingerprint.RequestFingerprinter``. Defaults to
+            scrapy's ``request_fingerprint``.
 
         """
         self.server = server
         self.key = key
         self.debug = debug
         self.logdupes = True
-        self.bloomfilter = RedisBloomFilter(server, key)
+        if bloomfilter is None:
+            bloomfilter = RedisBloomFilter(server, key)
+        self.bloomfilter = bloomfilter
+        self.fingerprinter = fingerprinter
 
     @classmethod
     def from_settings(cls, settings):
@@ -65,7 +189,11 @@ class RFPDupeFilter(BaseDupeFilter):
         # TODO: Use SCRAPY_JOB env as default and fallback to timestamp.
         key = defaults.DUPEFILTER_KEY % {'timestamp': int(time.time())}
         debug = settings.getbool('DUPEFILTER_DEBUG')
-        return cls(server, key=key, debug=debug)
+        bloomfilter = get_bloomfilter_from_settings(server, key, settings)
+        fingerprinter = None
+        if settings.get('DUPEFILTER_FINGERPRINTER'):
+            fingerprinter = load_object(settings['DUPEFILTER_FINGERPRINTER']).from_settings(settings)
+        return cls(server, key=key, debug=debug, bloomfilter=bloomfilter, fingerprinter=fingerprinter)
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -97,13 +225,37 @@ class RFPDupeFilter(BaseDupeFilter):
         """
         fp = self.request_fingerprint(request)
         # deprecated set of redis, use bloomfilter to implent filter
-        # This returns the number of values added, zero if already exists.
-        if self.bloomfilter.is_contains(fp):
-            return True
-        else:
-            self.bloomfilter.insert(fp)
-            return False
- 
+        # Atomic test-and-set, returns True if all bits were already set.
+        return self.bloomfilter.add(fp)
+
+    def request_seen(self, request):
+        """Returns True if request was already seen.
+
+        Called by Scrapy's default scheduler, so the bloomfilter also works
+        without ``scrapy_redis.scheduler.Scheduler``.
+
+        """
+        return self.request_seen_by_bloomfilter(request)
+
+    def requests_seen_by_bloomfilter(self, requests):
+        """Returns whether each of the given requests was already seen.
+
+        All fingerprints are checked and inserted together, costing one round
+        trip per bloomfilter block instead of one per request. Useful to dedupe
+        all outlinks of a page at once.
+
+        Parameters
+        ----------
+        requests : iterable of scrapy.http.Request
+
+        Returns
+        -------
+        list of bool
+            In the same order as ``requests``.
+
+        """
+        fps = [self.request_fingerprint(request) for request in requests]
+        return self.bloomfilter.add_many(fps)
 
     def request_fingerprint(self, request):
         """Returns a fingerprint for a given request.
@@ -117,6 +269,8 @@ class RFPDupeFilter(BaseDupeFilter):
         str
 
         """
+        if self.fingerprinter is not None:
+            return self.fingerprinter.fingerprint(request)
         return request_fingerprint(request)
 
     @classmethod
@@ -126,21 +280,27 @@ class RFPDupeFilter(BaseDupeFilter):
         dupefilter_key = settings.get("SCHEDULER_DUPEFILTER_KEY", defaults.SCHEDULER_DUPEFILTER_KEY)
         key = dupefilter_key % {'spider': spider.name}
         debug = settings.getbool('DUPEFILTER_DEBUG')
-        return cls(server, key=key, debug=debug)
+        bloomfilter = get_bloomfilter_from_settings(server, key, settings)
+        fingerprinter = None
+        if settings.get('DUPEFILTER_FINGERPRINTER'):
+            fingerprinter = load_object(settings['DUPEFILTER_FINGERPRINTER']).from_spider(spider)
+        return cls(server, key=key, debug=debug, bloomfilter=bloomfilter, fingerprinter=fingerprinter)
 
     def close(self, reason=''):
-        """Delete data on close. Called by Scrapy's scheduler.
+        """Release the bloomfilter on close. Called by Scrapy's scheduler.
+
+        The fingerprints are kept, ``clear`` deletes them.
 
         Parameters
         ----------
         reason : str, optional
 
         """
-        self.clear()
+        self.bloomfilter.close()
 
     def clear(self):
         """Clears fingerprints data."""
-        self.server.delete(self.key)
+        self.bloomfilter.clear()
 
     def log(self, request, spider):
         """Logs given request.
@@ -160,3 +320,136 @@ class RFPDupeFilter(BaseDupeFilter):
                    " (see DUPEFILTER_DEBUG to show all duplicates)")
             self.logger.debug(msg, {'request': request}, extra={'spider': spider})
             self.logdupes = False
+
+
+class AsyncRFPDupeFilter(RFPDupeFilter):
+    """Redis-based request duplicates filter resolving requests off the reactor.
+
+    Used by ``scrapy_redis.scheduler.Scheduler``, candidate requests are
+    buffered and checked by batches on a worker thread, which also releases
+    the new requests to the scheduler queue. The time spent in the reactor
+    per request does not depend on redis latency.
+
+    Settings
+    --------
+    DUPEFILTER_ASYNC_BATCH_SIZE : int (default: 100)
+        Number of buffered requests that triggers a batch.
+    DUPEFILTER_ASYNC_INTERVAL : float (default: 0.05)
+        Seconds between flushes of a partial batch.
+
+    """
+
+    batch_size = defaults.DUPEFILTER_ASYNC_BATCH_SIZE
+    flush_interval = defaults.DUPEFILTER_ASYNC_INTERVAL
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncRFPDupeFilter, self).__init__(*args, **kwargs)
+        self.pending = []
+        self.resolving = 0
+        self.release = None
+        self.spider = None
+        self._deferred = None
+        self._task = None
+        self._closing = False
+
+    @classmethod
+    def from_settings(cls, settings):
+        df = super(AsyncRFPDupeFilter, cls).from_settings(settings)
+        df._configure(settings)
+        return df
+
+    @classmethod
+    def from_spider(cls, spider):
+        df = super(AsyncRFPDupeFilter, cls).from_spider(spider)
+        df._configure(spider.settings)
+        return df
+
+    def _configure(self, settings):
+        self.batch_size = settings.getint('DUPEFILTER_ASYNC_BATCH_SIZE', self.batch_size)
+        self.flush_interval = settings.getfloat('DUPEFILTER_ASYNC_INTERVAL', self.flush_interval)
+
+    def __len__(self):
+        """Returns the number of requests not resolved yet."""
+        return len(self.pending) + self.resolving
+
+    def open_buffer(self, release, spider):
+        """Start buffering requests.
+
+        Parameters
+        ----------
+        release : callable
+            Called on the worker thread with the list of new requests.
+        spider : scrapy.spiders.Spider
+
+        """
+        self.release = release
+        self.spider = spider
+        self._task = task.LoopingCall(self.flush)
+        self._task.start(self.flush_interval, now=False)
+
+    def close_buffer(self):
+        """Stop buffering and resolve the remaining requests.
+
+        Returns
+        -------
+        twisted.internet.defer.Deferred
+            Fired once the batch running on the worker thread, then the
+            remaining requests, are released.
+
+        """
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        self._closing = True
+        d = defer.succeed(None)
+        if self._deferred is not None:
+            d = defer.Deferred()
+            self._deferred.addBoth(_passthrough, d.callback, None)
+        d.addCallback(self._drain)
+        return d
+
+    def _drain(self, _):
+        batch, self.pending = self.pending, []
+        if batch:
+            self._log_dupes(self._resolve(batch))
+
+    def defer_request(self, request):
+        """Buffer a request, it is released to the queue later if new."""
+        self.pending.append(request)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Resolve the buffered requests on the worker thread.
+
+        Only one batch runs at a time, so the requests are released in order.
+
+        """
+        if self._closing or self._deferred is not None or not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.resolving = len(batch)
+        self._deferred = threads.deferToThread(self._resolve, batch)
+        self._deferred.addCallbacks(self._log_dupes, self._log_failure)
+        self._deferred.addBoth(self._resolved)
+
+    def _resolve(self, batch):
+        """Returns the duplicates of batch after releasing the new requests."""
+        seen = self.requests_seen_by_bloomfilter(batch)
+        self.release([request for request, dupe in zip(batch, seen) if not dupe])
+        return [request for request, dupe in zip(batch, seen) if dupe]
+
+    def _log_dupes(self, dupes):
+        for request in dupes:
+            self.log(request, self.spider)
+
+    def _log_failure(self, failure):
+        self.logger.error("Failed to resolve buffered requests: %(failure)s",
+                          {'failure': failure.getErrorMessage()},
+                          exc_info=(failure.type, failure.value, failure.getTracebackObject()),
+                          extra={'spider': self.spider})
+
+    def _resolved(self, _):
+        self._deferred = None
+        self.resolving = 0
+        if len(self.pending) >= self.batch_size:
+            self.flush()
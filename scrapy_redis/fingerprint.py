@@ -0,0 +1,144 @@
+import fnmatch
+import hashlib
+import re
+import zlib
+
+from six.moves.urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from w3lib.url import canonicalize_url
+
+from utils.bloomfilter import Digest
+from . import defaults
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class RequestFingerprinter(object):
+    """Canonicalizing request fingerprinter.
+
+    Trivially different URLs of the same page get the same fingerprint: the
+    host is lowercased, default ports, fragments, path session ids and the
+    tracking or session query parameters are dropped, and the remaining
+    query parameters are sorted. The fingerprint is the md5 hex digest of the
+    method, canonical URL and body, computed once and stored in the request
+    meta, with a crc32 of the raw method, URL and body, so that later stages,
+    and the request popped back from the queue, reuse it. It is returned as a
+    ``Digest`` so the bloomfilter does not hash it again.
+
+    Settings
+    --------
+    DUPEFILTER_FINGERPRINT_DROP_PARAMS : list
+        Query parameter name patterns (fnmatch, case insensitive) to drop.
+    DUPEFILTER_FINGERPRINT_KEEP_FRAGMENTS : bool (default: False)
+        Whether the URL fragment tells pages apart.
+
+    Spiders can override them with the ``fingerprint_drop_params`` and
+    ``fingerprint_keep_fragments`` attributes.
+
+    """
+
+    meta_key = '_fingerprint'
+
+    def __init__(self, drop_params=defaults.DUPEFILTER_FINGERPRINT_DROP_PARAMS, keep_fragments=False):
+        """Initialize the fingerprinter.
+
+        Parameters
+        ----------
+        drop_params : list of str
+            Query parameter name patterns to drop.
+        keep_fragments : bool
+            Whether to keep the URL fragment.
+
+        """
+        self.drop_params = drop_params
+        self.keep_fragments = keep_fragments
+
+    @property
+    def drop_params(self):
+        return self._drop_params
+
+    @drop_params.setter
+    def drop_params(self, patterns):
+        self._drop_params = list(patterns)
+        # one regex instead of fnmatch of each pattern for each parameter
+        regex = '|'.join(fnmatch.translate(pattern) for pattern in self._drop_params) or r'(?!)'
+        self._drop_match = re.compile(regex, re.IGNORECASE).match
+
+    @classmethod
+    def from_settings(cls, settings):
+        drop_params = settings.getlist('DUPEFILTER_FINGERPRINT_DROP_PARAMS',
+                                       defaults.DUPEFILTER_FINGERPRINT_DROP_PARAMS)
+        keep_fragments = settings.getbool('DUPEFILTER_FINGERPRINT_KEEP_FRAGMENTS')
+        return cls(drop_params=drop_params, keep_fragments=keep_fragments)
+
+    @classmethod
+    def from_spider(cls, spider):
+        fingerprinter = cls.from_settings(spider.settings)
+        drop_params = getattr(spider, 'fingerprint_drop_params', None)
+        if drop_params is not None:
+            fingerprinter.drop_params = drop_params
+        fingerprinter.keep_fragments = getattr(spider, 'fingerprint_keep_fragments',
+                                               fingerprinter.keep_fragments)
+        return fingerprinter
+
+    def _dropped(self, name):
+        return self._drop_match(name) is not None
+
+    def canonicalize(self, url):
+        """Returns the canonical form of url."""
+        parts = urlsplit(url)
+        scheme, netloc, path, query, fragment = parts
+        # canonicalize_url lowercases, sorts the query and normalizes the
+        # escaping, the url is only rebuilt when a rule here changes it
+        host, _, port = netloc.rpartition(':')
+        if host and port.isdigit() and int(port) == DEFAULT_PORTS.get(scheme.lower()):
+            netloc = host
+        # path parameters like ;jsessionid=...
+        if ';' in path:
+            segments = []
+            for segment in path.split('/'):
+                params = segment.split(';')
+                segments.append(';'.join([params[0]] + [p for p in params[1:]
+                                                        if not self._dropped(p.partition('=')[0])]))
+            path = '/'.join(segments)
+        if query:
+            pairs = parse_qsl(query, keep_blank_values=True)
+            kept = [(name, value) for name, value in pairs if not self._dropped(name)]
+            if len(kept) != len(pairs):
+                query = urlencode(kept)
+        if (scheme, netloc, path, query, fragment) != tuple(parts):
+            url = urlunsplit((scheme, netloc, path, query, fragment))
+        return canonicalize_url(url, keep_fragments=self.keep_fragments)
+
+    def fingerprint(self, request):
+        """Returns the fingerprint of request, computing it only once.
+
+        Parameters
+        ----------
+        request : scrapy.http.Request
+
+        Returns
+        -------
+        utils.bloomfilter.Digest
+
+        """
+        # the meta is copied by request.replace() and shared by requests made
+        # with meta=response.meta, so the cached digest is only trusted when the
+        # crc32 of the method, url and body still matches
+        url = request.url.encode('utf-8')
+        body = request.body or b''
+        check = zlib.crc32(body, zlib.crc32(url, zlib.crc32(request.method.encode('ascii'))))
+        check = '%08x' % (check & 0xffffffff)
+        cached = request.meta.get(self.meta_key)
+        if cached and cached[:8] == check:
+            return Digest(cached[8:])
+        fp = hashlib.md5()
+        fp.update(request.method.encode('ascii'))
+        fp.update(b' ')
+        fp.update(self.canonicalize(request.url).encode('utf-8'))
+        fp.update(b' ')
+        fp.update(body)
+        digest = fp.hexdigest()
+        # a string, kept as it is by every serializer
+        request.meta[self.meta_key] = check + digest
+        return Digest(digest)
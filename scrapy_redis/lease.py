@@ -0,0 +1,293 @@
+import threading
+import time
+import uuid
+
+from scrapy import Request
+from scrapy.utils.reqser import request_to_dict, request_from_dict
+
+from . import picklecompat
+
+
+# Sent with the request when it is fully processed, the scheduler then
+# acknowledges its lease.
+request_processed = object()
+
+# Appended to the pop scripts of the queues, leases the payloads of the local
+# ``leased`` in the script that pops them. The lease keys and the deadline and
+# token prefix are the last keys and arguments.
+LEASE_SCRIPT = """
+local deadline = tonumber(ARGV[#ARGV - 1])
+for i, data in ipairs(leased) do
+    local token = ARGV[#ARGV] .. i
+    redis.call('HSET', KEYS[#KEYS - 1], token, data)
+    redis.call('ZADD', KEYS[#KEYS], deadline, token)
+end
+"""
+
+
+class LeaseTracker(object):
+    """In-flight requests of a queue, requeued when their lease expires.
+
+    A leased request is stored in the hash ``<key>:leases`` under a random
+    token, and the token in the sorted set ``<key>:inflight`` scored by the
+    lease deadline. The token is kept in the request meta until the request is
+    acknowledged. Acknowledgements are buffered and sent by ``sweep``, which
+    also moves the expired leases of any process back to the queue.
+
+    The queues lease the requests in the script popping them, see
+    ``LEASE_SCRIPT``, so the tracker lives on the server of its queue.
+
+    """
+
+    meta_key = '_lease'
+    requeues_key = '_lease_requeues'
+
+    claim_script = """
+    local tokens = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+    local leased = {}
+    for _, token in ipairs(tokens) do
+        redis.call('ZREM', KEYS[1], token)
+        table.insert(leased, redis.call('HGET', KEYS[2], token))
+        redis.call('HDEL', KEYS[2], token)
+    end
+    return leased
+    """
+
+    renew_script = """
+    local claimed = {}
+    for i = 2, #ARGV do
+        if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+            redis.call('ZADD', KEYS[1], tonumber(ARGV[1]), ARGV[i])
+        else
+            table.insert(claimed, ARGV[i])
+        end
+    end
+    return claimed
+    """
+
+    def __init__(self, server, key, spider, serializer=None, timeout=600, max_requeues=3, sweep_batch=100,
+                 prefix=''):
+        """Initialize the lease tracker.
+
+        Parameters
+        ----------
+        server : StrictRedis
+            Redis client instance.
+        key : str
+            Prefix of the redis keys, the queue key.
+        spider : scrapy.spiders.Spider
+        serializer : object
+            Serializer object with ``loads`` and ``dumps`` methods.
+        timeout : float
+            Seconds a request is leased for.
+        max_requeues : int
+            Number of times a request is requeued before it is dropped.
+        sweep_batch : int
+            Number of expired leases requeued by each sweep.
+        prefix : str
+            Prefix of the tokens, tells the trackers of a ``LeaseGroup`` apart.
+
+        """
+        self.server = server
+        self.inflight_key = '%s:inflight' % key
+        self.leases_key = '%s:leases' % key
+        self.spider = spider
+        self.serializer = serializer or picklecompat
+        self.timeout = timeout
+        self.max_requeues = max_requeues
+        self.sweep_batch = sweep_batch
+        self.prefix = prefix
+        self._claim = server.register_script(self.claim_script)
+        self._renew = server.register_script(self.renew_script)
+        self._acks = []
+        # Requests can be acknowledged from the dupefilter worker thread.
+        self._acks_lock = threading.Lock()
+
+    def __len__(self):
+        return self.server.zcard(self.inflight_key)
+
+    @property
+    def keys(self):
+        """Keys given last to a script ending with ``LEASE_SCRIPT``"""
+        return [self.leases_key, self.inflight_key]
+
+    def script_args(self):
+        """Arguments given last to a script ending with ``LEASE_SCRIPT``.
+
+        The token of the i-th leased payload, from 1, is the prefix followed
+        by i.
+
+        """
+        return [time.time() + self.timeout, '%s%s:' % (self.prefix, uuid.uuid4().hex)]
+
+    def lease(self, request):
+        """Lease request until it is acknowledged or the lease expires.
+
+        For the requests popped by a blocking command, which can not be sent
+        from a script.
+
+        """
+        token = self.prefix + uuid.uuid4().hex
+        data = self.serializer.dumps(request_to_dict(request, self.spider))
+        pipe = self.server.pipeline(transaction=False)
+        pipe.hset(self.leases_key, token, data)
+        pipe.execute_command('ZADD', self.inflight_key, time.time() + self.timeout, token)
+        pipe.execute()
+        request.meta[self.meta_key] = token
+
+    def renew(self, tokens):
+        """Extend the leases of tokens by the timeout.
+
+        Returns
+        -------
+        tuple
+            The new deadline, and the set of tokens whose lease was claimed by
+            a sweep meanwhile, so their request was requeued.
+
+        """
+        deadline = time.time() + self.timeout
+        claimed = self._renew(keys=[self.inflight_key], args=[deadline] + list(tokens))
+        return deadline, set(token.decode('utf-8') if isinstance(token, bytes) else token for token in claimed)
+
+    def ack(self, request):
+        """Acknowledge the lease of request, if it has one.
+
+        The lease is removed from the request, so requests copied from it with
+        its meta, like retries and redirects, are acknowledged only once.
+
+        """
+        token = request.meta.pop(self.meta_key, None)
+        if token is not None:
+            self.ack_token(token)
+
+    def ack_token(self, token):
+        with self._acks_lock:
+            self._acks.append(token)
+
+    def release(self, pipe, tokens):
+        """Add the commands removing the leases of tokens to pipe"""
+        pipe.zrem(self.inflight_key, *tokens)
+        pipe.hdel(self.leases_key, *tokens)
+
+    def flush(self):
+        """Send the buffered acknowledgements."""
+        with self._acks_lock:
+            tokens, self._acks = self._acks, []
+        if tokens:
+            pipe = self.server.pipeline(transaction=False)
+            self.release(pipe, tokens)
+            pipe.execute()
+
+    def sweep(self):
+        """Send the acknowledgements and claim the expired leases.
+
+        Returns
+        -------
+        tuple
+            The requests to requeue and the number of dropped requests.
+
+        """
+        self.flush()
+        requeue = []
+        dropped = 0
+        for data in self._claim(keys=[self.inflight_key, self.leases_key], args=[time.time(), self.sweep_batch]):
+            if data is None:
+                # Acknowledged meanwhile.
+                continue
+            request = request_from_dict(self.serializer.loads(data), self.spider)
+            request.meta.pop(self.meta_key, None)
+            requeues = request.meta.get(self.requeues_key, 0) + 1
+            if requeues > self.max_requeues:
+                dropped += 1
+                continue
+            request.meta[self.requeues_key] = requeues
+            requeue.append(request)
+        return requeue, dropped
+
+    def clear(self):
+        with self._acks_lock:
+            self._acks = []
+        self.server.delete(self.inflight_key, self.leases_key)
+
+
+class LeaseGroup(object):
+    """Leases of several queues, like the shards of a ``ShardedQueue``.
+
+    The tokens of the i-th tracker start with ``'<i>:'``, which routes their
+    acknowledgements.
+
+    """
+
+    def __init__(self, trackers):
+        self.trackers = trackers
+        for index, tracker in enumerate(trackers):
+            tracker.prefix = '%d:' % index
+
+    def __len__(self):
+        return sum(len(tracker) for tracker in self.trackers)
+
+    def ack(self, request):
+        token = request.meta.pop(LeaseTracker.meta_key, None)
+        if token is not None:
+            self.trackers[int(token.partition(':')[0])].ack_token(token)
+
+    def flush(self):
+        for tracker in self.trackers:
+            tracker.flush()
+
+    def sweep(self):
+        requeue = []
+        dropped = 0
+        for tracker in self.trackers:
+            requests, count = tracker.sweep()
+            requeue.extend(requests)
+            dropped += count
+        return requeue, dropped
+
+    def clear(self):
+        for tracker in self.trackers:
+            tracker.clear()
+
+
+class LeaseMiddleware(object):
+    """Acknowledges the lease of processed requests.
+
+    Enable it as a spider middleware, to acknowledge a request once all the
+    output of its callback was handled and remove the lease from the new
+    requests copying its meta, and as a downloader middleware with a low
+    order, to acknowledge requests that failed and were not retried::
+
+        SPIDER_MIDDLEWARES = {'scrapy_redis.lease.LeaseMiddleware': 0}
+        DOWNLOADER_MIDDLEWARES = {'scrapy_redis.lease.LeaseMiddleware': 0}
+
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _processed(self, request):
+        if LeaseTracker.meta_key in request.meta:
+            self.crawler.signals.send_catch_log(request_processed, request=request)
+
+    def process_spider_output(self, response, result, spider):
+        try:
+            for x in result:
+                if isinstance(x, Request):
+                    # New requests built with the meta of the response do not
+                    # inherit its lease.
+                    x.meta.pop(LeaseTracker.meta_key, None)
+                    x.meta.pop(LeaseTracker.requeues_key, None)
+                yield x
+        finally:
+            self._processed(response.request)
+
+    def process_spider_exception(self, response, exception, spider):
+        self._processed(response.request)
+
+    def process_exception(self, request, exception, spider):
+        # Called only when no retry was returned by a later middleware.
+        self._processed(request)
@@ -1,12 +1,35 @@
+import os
+import random
+import threading
+import time
+from hashlib import md5
+
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
 from scrapy.utils.reqser import request_to_dict, request_from_dict
 
-from . import picklecompat
+from utils.hashring import HashRing
+from . import defaults, picklecompat
+from .lease import LEASE_SCRIPT, LeaseGroup, LeaseTracker
+from .spill import SegmentLog
+
+
+def request_slot(request):
+    """Return the download slot of request, as scrapy's downloader does"""
+    return request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
 
 
 class Base(object):
     """Per-spider base queue class"""
 
-    def __init__(self, server, spider, key, serializer=None):
+    # Lua script popping requests, it sets the local ``result`` returned to
+    # the client and the local ``leased`` list of the popped payloads.
+    pop_script = None
+
+    def __init__(self, server, spider, key, serializer=None, push_buffer_size=0, push_buffer_time=0.1,
+                 spill_dir=None, spill_length=0, spill_memory=0, spill_refill=1000,
+                 spill_segment_size=64 << 20, spill_check_interval=1.0, lease_timeout=0,
+                 lease_max_requeues=defaults.SCHEDULER_LEASE_MAX_REQUEUES):
         """Initialize per-spider redis queue.
 
         Parameters
@@ -19,6 +42,32 @@ class Base(object):
             Redis key where to put and get messages.
         serializer : object
             Serializer object with ``loads`` and ``dumps`` methods.
+        push_buffer_size : int
+            Number of pushed requests to buffer locally and send together.
+            Disabled when lower than 2.
+        push_buffer_time : float
+            Seconds after which a partial buffer is sent on the next push.
+            The buffer is also sent before each pop, on close, and by the
+            scheduler every ``push_buffer_time``.
+        spill_dir : str
+            Directory where requests are spilled to local segment files while
+            the queue is above a watermark. Disabled when None.
+        spill_length : int
+            Number of requests in redis above which requests are spilled.
+        spill_memory : int
+            Redis used memory in bytes above which requests are spilled.
+        spill_refill : int
+            Number of spilled requests moved back to redis at a time, before
+            a pop, when the queue is below the watermarks.
+        spill_segment_size : int
+            Size in bytes of the segment files.
+        spill_check_interval : float
+            Seconds during which a watermark check is reused.
+        lease_timeout : float
+            Seconds a popped request is leased for, in the script popping it,
+            see ``scrapy_redis.lease.LeaseTracker``. Disabled when 0.
+        lease_max_requeues : int
+            Number of times a request is requeued before it is dropped.
 
         """
         if serializer is None:
@@ -31,11 +80,41 @@ class Base(object):
         if not hasattr(serializer, 'dumps'):
             raise TypeError("serializer '%s' does not implement 'dumps' function: %r"
                             % serializer)
+        if hasattr(serializer, 'for_spider'):
+            # Like scrapy_redis.compactcodec, which stores callbacks as ids.
+            serializer = serializer.for_spider(spider)
 
         self.server = server
         self.spider = spider
         self.key = key % {'spider': spider.name}
         self.serializer = serializer
+        self.push_buffer_size = push_buffer_size
+        self.push_buffer_time = push_buffer_time
+        self._buffer = []
+        self._buffer_since = None
+        # Requests can be pushed from the dupefilter worker thread.
+        self._buffer_lock = threading.Lock()
+        self._spill = None
+        # Refills are skipped while another thread refills.
+        self._refill_lock = threading.Lock()
+        if spill_dir:
+            self._spill = SegmentLog(os.path.join(spill_dir, self.key.replace(':', '_')), spill_segment_size)
+        self.spill_length = spill_length
+        self.spill_memory = spill_memory
+        self.spill_refill = spill_refill
+        self.spill_check_interval = spill_check_interval
+        self._overflow = False
+        self._overflow_checked = 0
+        # Requests popped ahead and served locally, with their lease token last.
+        self._prefetched = []
+        self._lease_deadline = 0
+        self.leases = None
+        if lease_timeout > 0:
+            self.leases = LeaseTracker(server, self.key, spider, serializer=serializer, timeout=lease_timeout,
+                                       max_requeues=lease_max_requeues)
+        if self.pop_script is not None:
+            script = self.pop_script + (LEASE_SCRIPT if self.leases is not None else '') + 'return result\n'
+            self._pop = server.register_script(script)
 
     def _encode_request(self, request):
         """Encode a request object"""
@@ -47,98 +126,567 @@ class Base(object):
         obj = self.serializer.loads(encoded_request)
         return request_from_dict(obj, self.spider)
 
+    def _call_pop(self, keys, args):
+        """Run the pop script, returns its result and the lease token prefix"""
+        if self.leases is None:
+            return self._pop(keys=keys, args=args), None
+        lease_args = self.leases.script_args()
+        self._lease_deadline = lease_args[0]
+        return self._pop(keys=keys + self.leases.keys, args=args + lease_args), lease_args[1]
+
+    def _decode_leased(self, encoded_request, token):
+        """Decode a request popped with the lease token"""
+        request = self._decode_request(encoded_request)
+        if token is not None:
+            request.meta[LeaseTracker.meta_key] = token
+        return request
+
+    def _decode_blocked(self, encoded_request):
+        """Decode and lease a request popped by a blocking command"""
+        request = self._decode_request(encoded_request)
+        if self.leases is not None:
+            self.leases.lease(request)
+        return request
+
+    def renew_leases(self):
+        """Renew the leases of the prefetched requests.
+
+        The requests whose lease was claimed by a sweep meanwhile were
+        requeued, so they are dropped from the local buffer.
+
+        """
+        tokens = [entry[-1] for entry in self._prefetched if entry[-1] is not None]
+        if not tokens:
+            return
+        self._lease_deadline, claimed = self.leases.renew(tokens)
+        if claimed:
+            self._prefetched = [entry for entry in self._prefetched if entry[-1] not in claimed]
+
+    def _renew_due(self):
+        """Renew the leases of the prefetched requests once half of their
+        time is gone"""
+        if (self._prefetched and self.leases is not None
+                and self._lease_deadline - time.time() < self.leases.timeout / 2.0):
+            self.renew_leases()
+
+    def _give_back(self, items, tokens):
+        """Push items back and release the leases of tokens"""
+        pipe = self.server.pipeline(transaction=False)
+        self._push_items(pipe, items)
+        tokens = [token for token in tokens if token is not None]
+        if tokens:
+            self.leases.release(pipe, tokens)
+        pipe.execute()
+
     def __len__(self):
         """Return the length of the queue"""
+        return self._queued() + len(self._buffer) + (len(self._spill) if self._spill is not None else 0)
+
+    def _queued(self):
+        """Return the number of requests in redis"""
         raise NotImplementedError
 
+    def _encode_item(self, request):
+        """Returns the item pushed for request, see ``_push_items``"""
+        return self._encode_request(request), -request.priority
+
     def push(self, request):
         """Push a request"""
+        item = self._encode_item(request)
+        if self.push_buffer_size < 2:
+            self._send([item])
+            return
+        with self._buffer_lock:
+            self._buffer.append(item)
+            if self._buffer_since is None:
+                self._buffer_since = time.time()
+            full = (len(self._buffer) >= self.push_buffer_size
+                    or time.time() - self._buffer_since >= self.push_buffer_time)
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Send the buffered requests in one round trip, and refill spilled
+        requests when the queue is below the watermarks"""
+        with self._buffer_lock:
+            items, self._buffer = self._buffer, []
+            self._buffer_since = None
+        if items:
+            self._send(items)
+        if self._spill is not None and len(self._spill) and not self._overflowing():
+            if not self._refill_lock.acquire(False):
+                return
+            try:
+                self._send_redis(self._spill.read(self.spill_refill))
+                # Removed from the segments only once they are in redis.
+                self._spill.commit()
+            finally:
+                self._refill_lock.release()
+            # The next refill waits for a new check of the watermarks.
+            self._overflow_checked = 0
+
+    def _overflowing(self):
+        """Return whether the queue is above a watermark"""
+        now = time.time()
+        if now - self._overflow_checked >= self.spill_check_interval:
+            self._overflow = bool(
+                (self.spill_length and self._queued() >= self.spill_length)
+                or (self.spill_memory and self.server.info('memory')['used_memory'] >= self.spill_memory))
+            self._overflow_checked = now
+        return self._overflow
+
+    def _send(self, items):
+        # Once requests are spilled the new ones go after them, which keeps
+        # the order of the FIFO queue.
+        if self._spill is not None and (len(self._spill) or self._overflowing()):
+            self._spill.append(items)
+        else:
+            self._send_redis(items)
+
+    def _send_redis(self, items):
+        if not items:
+            return
+        pipe = self.server.pipeline(transaction=False)
+        self._push_items(pipe, items)
+        pipe.execute()
+
+    def _push_items(self, pipe, items):
+        """Add the commands pushing items to pipe.
+
+        Parameters
+        ----------
+        pipe : redis.client.Pipeline
+        items : list
+            Pairs of encoded request and score (the negated priority).
+
+        """
         raise NotImplementedError
 
     def pop(self, timeout=0):
         """Pop a request"""
         raise NotImplementedError
 
+    def close(self):
+        """Send the buffered requests"""
+        self.flush()
+        if self._spill is not None:
+            self._spill.close()
+
     def clear(self):
         """Clear queue/stack"""
+        with self._buffer_lock:
+            self._buffer = []
+            self._buffer_since = None
+        if self._spill is not None:
+            self._spill.clear()
         self.server.delete(self.key)
 
 
 class FifoQueue(Base):
     """Per-spider FIFO queue"""
 
-    def __len__(self):
-        """Return the length of the queue"""
+    pop_script = """
+    local result = redis.call('RPOP', KEYS[1])
+    local leased = {}
+    if result then
+        leased[1] = result
+    end
+    """
+
+    def _queued(self):
         return self.server.llen(self.key)
 
-    def push(self, request):
-        """Push a request"""
-        self.server.lpush(self.key, self._encode_request(request))
+    def _push_items(self, pipe, items):
+        pipe.lpush(self.key, *[data for data, _ in items])
 
     def pop(self, timeout=0):
         """Pop a request"""
+        self.flush()
+        data, prefix = self._call_pop([self.key], [])
+        if data:
+            return self._decode_leased(data, prefix and prefix + '1')
         if timeout > 0:
             data = self.server.brpop(self.key, timeout)
             if isinstance(data, tuple):
                 data = data[1]
-        else:
-            data = self.server.rpop(self.key)
-        if data:
-            return self._decode_request(data)
+            if data:
+                return self._decode_blocked(data)
 
 
 class PriorityQueue(Base):
     """Per-spider priority queue abstraction using redis' sorted set"""
 
+    pop_script = """
+    local result = redis.call('ZPOPMIN', KEYS[1], tonumber(ARGV[1]))
+    local leased = {}
+    for i = 1, #result, 2 do
+        table.insert(leased, result[i])
+    end
+    """
+
+    def __init__(self, server, spider, key, serializer=None, prefetch=1, **kwargs):
+        """Initialize per-spider priority queue.
+
+        Parameters
+        ----------
+        prefetch : int
+            Number of highest priority requests taken from redis by each
+            ZPOPMIN and served locally by the next pops. Requests pushed
+            meanwhile with a higher priority wait behind the prefetched ones.
+
+        See ``Base`` for the other parameters.
+
+        """
+        super(PriorityQueue, self).__init__(server, spider, key, serializer, **kwargs)
+        if prefetch < 1:
+            raise TypeError("prefetch must be positive: %r" % prefetch)
+        self.prefetch = prefetch
+
     def __len__(self):
         """Return the length of the queue"""
+        return super(PriorityQueue, self).__len__() + len(self._prefetched)
+
+    def _queued(self):
         return self.server.zcard(self.key)
 
-    def push(self, request):
-        """Push a request"""
-        data = self._encode_request(request)
-        score = -request.priority
+    def _push_items(self, pipe, items):
+        args = []
+        for data, score in items:
+            args.extend((score, data))
         # We don't use zadd method as the order of arguments change depending on
         # whether the class is Redis or StrictRedis, and the option of using
         # kwargs only accepts strings, not bytes.
-        self.server.execute_command('ZADD', self.key, score, data)
+        pipe.execute_command('ZADD', self.key, *args)
+
+    def pop(self, timeout=0):
+        """Pop a request
+
+        Takes up to ``prefetch`` requests, and leases them, with one atomic
+        ZPOPMIN script when the local buffer is empty. With a timeout, waits
+        for a request with BZPOPMIN when the queue is empty.
+
+        """
+        self._renew_due()
+        if not self._prefetched:
+            self.flush()
+            popped, prefix = self._call_pop([self.key], [self.prefetch])
+            for i in range(0, len(popped), 2):
+                token = prefix and '%s%d' % (prefix, i // 2 + 1)
+                self._prefetched.append((popped[i], float(popped[i + 1]), token))
+            if not self._prefetched and timeout > 0:
+                popped = self.server.bzpopmin(self.key, timeout)
+                if popped:
+                    return self._decode_blocked(popped[1])
+        if self._prefetched:
+            data, score, token = self._prefetched.pop(0)
+            return self._decode_leased(data, token)
+
+    def close(self):
+        """Send the buffered requests and give back the prefetched ones"""
+        super(PriorityQueue, self).close()
+        prefetched, self._prefetched = self._prefetched, []
+        if prefetched:
+            self._give_back([(data, score) for data, score, _ in prefetched],
+                            [token for _, _, token in prefetched])
+
+    def clear(self):
+        """Clear queue"""
+        self._prefetched = []
+        super(PriorityQueue, self).clear()
+
+
+class HostPriorityQueue(Base):
+    """Per-spider queue rotating across hosts with a politeness delay.
+
+    Each host (the download slot of the request) has its own sorted set of
+    requests, and a sorted set indexes the hosts by the time they are ready
+    again. A pop takes the highest priority request of the host that has been
+    ready the longest, in one Lua script, and makes the host wait the delay.
+    Priorities are only compared between requests of the same host.
+
+    The ready times come from the clocks of the crawlers, which should be in
+    sync. A host whose requests run out keeps its ready time in another sorted
+    set until it passes, so a request pushed for it meanwhile still waits the
+    delay.
+
+    The pop script reaches the host keys through names built in Lua, not
+    declared in KEYS, so the queue needs a single redis node, not a Redis
+    Cluster. ``ShardedQueue`` spreads hosts over several nodes instead.
+
+    """
+
+    pop_script = """
+    local now = tonumber(ARGV[1])
+    local hosts = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[3]))
+    local popped = {}
+    local leased = {}
+    for _, host in ipairs(hosts) do
+        local host_key = ARGV[4] .. host
+        local item = redis.call('ZPOPMIN', host_key)
+        if item[1] then
+            table.insert(popped, host)
+            table.insert(popped, item[1])
+            table.insert(popped, item[2])
+            table.insert(leased, item[1])
+        end
+        if redis.call('EXISTS', host_key) == 0 then
+            redis.call('ZREM', KEYS[1], host)
+            redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), host)
+        else
+            redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), host)
+        end
+    end
+    if #popped > 0 then
+        redis.call('DECRBY', KEYS[2], #popped / 3)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+    local first = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    table.insert(popped, 1, first[2] or false)
+    local result = popped
+    """
+
+    # Adds the requests of a host, which is ready at the earliest of now and
+    # the ready time kept when its requests ran out.
+    push_script = """
+    redis.call('ZADD', KEYS[1], unpack(ARGV, 3))
+    local ready = math.max(tonumber(ARGV[1]), tonumber(redis.call('ZSCORE', KEYS[3], ARGV[2]) or 0))
+    redis.call('ZADD', KEYS[2], 'NX', ready, ARGV[2])
+    redis.call('ZREM', KEYS[3], ARGV[2])
+    """
+
+    def __init__(self, server, spider, key, serializer=None, delay=None, prefetch=1, poll_interval=0.1,
+                 **kwargs):
+        """Initialize per-spider host queue.
+
+        Parameters
+        ----------
+        delay : float
+            Seconds between two pops of the same host. Defaults to the
+            spider ``download_delay`` or the ``DOWNLOAD_DELAY`` setting.
+        prefetch : int
+            Number of ready hosts a request is popped from by each script
+            call and served locally by the next pops.
+        poll_interval : float
+            Wait between two pops while the queue is empty, with a timeout.
+
+        See ``Base`` for the other parameters.
+
+        """
+        super(HostPriorityQueue, self).__init__(server, spider, key, serializer, **kwargs)
+        if delay is None:
+            settings = getattr(spider, 'settings', None)
+            delay = getattr(spider, 'download_delay', settings.getfloat('DOWNLOAD_DELAY') if settings else 0)
+        if prefetch < 1:
+            raise TypeError("prefetch must be positive: %r" % prefetch)
+        self.delay = delay
+        self.prefetch = prefetch
+        self.poll_interval = poll_interval
+        self.ready_key = '%s:ready' % self.key
+        self.count_key = '%s:count' % self.key
+        self.host_key = '%s:host:' % self.key
+        self.next_key = '%s:next' % self.key
+        self._push_host = server.register_script(self.push_script)
+
+    def __len__(self):
+        """Return the length of the queue"""
+        return super(HostPriorityQueue, self).__len__() + len(self._prefetched)
+
+    def _queued(self):
+        return int(self.server.get(self.count_key) or 0)
+
+    def _encode_item(self, request):
+        data, score = super(HostPriorityQueue, self)._encode_item(request)
+        return data, score, request_slot(request)
+
+    def _push_items(self, pipe, items):
+        hosts = {}
+        for data, score, host in items:
+            hosts.setdefault(host, []).extend((score, data))
+        now = time.time()
+        for host, args in hosts.items():
+            # Hosts already queued keep their ready time.
+            self._push_host(keys=[self.host_key + host, self.ready_key, self.next_key],
+                            args=[now, host] + args, client=pipe)
+        pipe.incrby(self.count_key, len(items))
+
+    def _pop_ready(self):
+        """Pops the requests of the ready hosts, returns the next ready time"""
+        popped, prefix = self._call_pop([self.ready_key, self.count_key, self.next_key],
+                                        [time.time(), self.delay, self.prefetch, self.host_key])
+        first = popped[0]
+        for i in range(1, len(popped), 3):
+            host, data, score = popped[i:i + 3]
+            if isinstance(host, bytes):
+                host = host.decode('utf-8')
+            token = prefix and '%s%d' % (prefix, i // 3 + 1)
+            self._prefetched.append((data, float(score), host, token))
+        return float(first) if first is not None else None
 
     def pop(self, timeout=0):
+        """Pop a request
+
+        With a timeout, waits for requests while the queue is empty. When
+        hosts are queued but none is ready yet, which is the steady state of a
+        polite crawl, returns None at once instead of blocking the reactor.
+
         """
-        Pop a request
-        timeout not support in this queue class
+        self._renew_due()
+        if not self._prefetched:
+            self.flush()
+            deadline = time.time() + timeout
+            while True:
+                ready = self._pop_ready()
+                now = time.time()
+                if self._prefetched or ready is not None or now >= deadline:
+                    break
+                time.sleep(max(0, min(deadline - now, self.poll_interval)))
+        if self._prefetched:
+            data, score, host, token = self._prefetched.pop(0)
+            return self._decode_leased(data, token)
+
+    def close(self):
+        """Send the buffered requests and give back the prefetched ones"""
+        super(HostPriorityQueue, self).close()
+        prefetched, self._prefetched = self._prefetched, []
+        if prefetched:
+            self._give_back([(data, score, host) for data, score, host, _ in prefetched],
+                            [token for _, _, _, token in prefetched])
+
+    def clear(self):
+        """Clear queue"""
+        self._prefetched = []
+        super(HostPriorityQueue, self).clear()
+        keys = [self.ready_key, self.count_key, self.next_key] + list(self.server.scan_iter(match=self.host_key + '*'))
+        self.server.delete(*keys)
+
+
+class ShardedQueue(object):
+    """Per-spider queue spread over several redis keys and nodes.
+
+    Each shard is a queue of ``shard_cls`` at ``<key>:<index>``, placed on a
+    node by consistent hashing of its key. Requests go to the shard of their
+    download slot, so a host stays in one shard, and pops take turns over the
+    shards. When all the shards are empty a pop with a timeout only waits on
+    the next shard.
+
+    """
+
+    def __init__(self, server, spider, key, serializer=None, shards=4, nodes=None,
+                 shard_cls=defaults.SCHEDULER_QUEUE_SHARD_CLASS, **kwargs):
+        """Initialize per-spider sharded queue.
+
+        Parameters
+        ----------
+        shards : int
+            Number of shards.
+        nodes : dict
+            Node url to redis client instance the shards are placed on. The
+            shards are all on server when empty.
+        shard_cls : str
+            Importable path to the queue class of the shards.
+
+        See ``Base`` for the other parameters, the extra keyword arguments
+        are given to the shard queues.
+
         """
-        # use atomic range/remove using multi/exec
-        pipe = self.server.pipeline()
-        pipe.multi()
-        pipe.zrange(self.key, 0, 0).zremrangebyrank(self.key, 0, 0)
-        results, count = pipe.execute()
-        if results:
-            return self._decode_request(results[0])
+        if shards < 1:
+            raise TypeError("shards must be positive: %r" % shards)
+        self.server = server
+        self.spider = spider
+        self.key = key % {'spider': spider.name}
+        ring = HashRing(nodes) if nodes else None
+        self.shards = []
+        for index in range(shards):
+            shard_key = '%s:%d' % (self.key, index)
+            self.shards.append(load_object(shard_cls)(
+                server=ring.get_node(shard_key) if ring else server,
+                spider=spider,
+                key=shard_key,
+                serializer=serializer,
+                **kwargs
+            ))
+        self.leases = None
+        if self.shards[0].leases is not None:
+            self.leases = LeaseGroup([shard.leases for shard in self.shards])
+        # Processes start at different shards.
+        self._next = random.randrange(shards)
+
+    def __len__(self):
+        """Return the length of the queue"""
+        return sum(len(shard) for shard in self.shards)
+
+    def shard_for(self, request):
+        """Return the shard queue of request"""
+        digest = md5(request_slot(request).encode('utf-8')).hexdigest()
+        return self.shards[int(digest[:8], 16) % len(self.shards)]
+
+    def push(self, request):
+        """Push a request"""
+        self.shard_for(request).push(request)
+
+    def pop(self, timeout=0):
+        """Pop a request"""
+        for _ in range(len(self.shards)):
+            shard = self.shards[self._next]
+            self._next = (self._next + 1) % len(self.shards)
+            request = shard.pop()
+            if request is not None:
+                return request
+        if timeout > 0:
+            shard = self.shards[self._next]
+            self._next = (self._next + 1) % len(self.shards)
+            return shard.pop(timeout)
+
+    def flush(self):
+        """Send the buffered requests"""
+        for shard in self.shards:
+            shard.flush()
+
+    def renew_leases(self):
+        """Renew the leases of the prefetched requests"""
+        for shard in self.shards:
+            shard.renew_leases()
+
+    def close(self):
+        """Close the shards"""
+        for shard in self.shards:
+            shard.close()
+
+    def clear(self):
+        """Clear the shards"""
+        for shard in self.shards:
+            shard.clear()
 
 
 class LifoQueue(Base):
     """Per-spider LIFO queue."""
 
-    def __len__(self):
-        """Return the length of the stack"""
+    pop_script = """
+    local result = redis.call('LPOP', KEYS[1])
+    local leased = {}
+    if result then
+        leased[1] = result
+    end
+    """
+
+    def _queued(self):
         return self.server.llen(self.key)
 
-    def push(self, request):
-        """Push a request"""
-        self.server.lpush(self.key, self._encode_request(request))
+    def _push_items(self, pipe, items):
+        pipe.lpush(self.key, *[data for data, _ in items])
 
     def pop(self, timeout=0):
         """Pop a request"""
+        self.flush()
+        data, prefix = self._call_pop([self.key], [])
+        if data:
+            return self._decode_leased(data, prefix and prefix + '1')
         if timeout > 0:
             data = self.server.blpop(self.key, timeout)
             if isinstance(data, tuple):
                 data = data[1]
-        else:
-            data = self.server.lpop(self.key)
-
-        if data:
-            return self._decode_request(data)
+            if data:
+                return self._decode_blocked(data)
 
 
 # TODO: Deprecate the use of these names.
@@ -1,9 +1,15 @@
 import importlib
+import time
+
 import six
 
 from scrapy.utils.misc import load_object
+from twisted.internet import defer, reactor, task
 
 from . import connection, defaults
+from .compression import CompressedSerializer
+from .lease import request_processed
+from .utils import IdleBackoff
 
 
 # TODO: add SCRAPY_JOB support.
@@ -27,7 +33,63 @@ class Scheduler(object):
     SCHEDULER_DUPEFILTER_CLASS : str
         Scheduler dupefilter class.
     SCHEDULER_SERIALIZER : str
-        Scheduler serializer.
+        Scheduler serializer, like ``scrapy_redis.compactcodec``.
+    SCHEDULER_QUEUE_SHARDS : int
+        Number of shards of ``ShardedQueue``.
+    SCHEDULER_QUEUE_REDIS_NODES : list
+        Redis urls the shards of ``ShardedQueue`` are spread over.
+    SCHEDULER_QUEUE_SHARD_CLASS : str
+        Queue class of the shards of ``ShardedQueue``.
+    SCHEDULER_QUEUE_SPILL_DIR : str
+        Local directory where requests are spilled above a watermark.
+    SCHEDULER_QUEUE_SPILL_LENGTH : int (default: 0)
+        Queue length in redis above which requests are spilled.
+    SCHEDULER_QUEUE_SPILL_MEMORY : int (default: 0)
+        Redis used memory in bytes above which requests are spilled.
+    SCHEDULER_QUEUE_SPILL_REFILL : int (default: 1000)
+        Number of spilled requests moved back to redis at a time.
+    SCHEDULER_QUEUE_SPILL_SEGMENT_SIZE : int (default: 64MB)
+        Size in bytes of the spill segment files.
+    SCHEDULER_COMPRESSION_THRESHOLD : int (default: 0)
+        Serialized requests of at least this many bytes are compressed.
+    SCHEDULER_COMPRESSION_LEVEL : int (default: 6)
+        zlib compression level.
+    SCHEDULER_COMPRESSION_DICT : str
+        Path to a preset dictionary made by ``train_dictionary``.
+    SCHEDULER_QUEUE_PUSH_BUFFER_SIZE : int (default: 0)
+        Number of requests buffered and pushed to redis in one round trip.
+    SCHEDULER_QUEUE_PUSH_BUFFER_TIME : float (default: 0.1)
+        Seconds after which a partial push buffer is sent.
+    SCHEDULER_QUEUE_PREFETCH : int (default: 1)
+        Number of requests popped together by ``PriorityQueue`` and
+        ``HostPriorityQueue``.
+
+    SCHEDULER_IDLE_BACKOFF_MAX : float (default: 0)
+        Longest wait in seconds between two pops of an empty queue, when
+        SCHEDULER_IDLE_BEFORE_CLOSE is 0. Disabled when 0.
+    SCHEDULER_IDLE_BACKOFF_MIN : float (default: 0.5)
+        First wait in seconds after an empty pop.
+    SCHEDULER_IDLE_NOTIFY : bool (default: False)
+        Publish on ``<queue key>:notify`` when requests are pushed, which
+        ends the idle wait of the other processes.
+    SCHEDULER_LENGTH_REFRESH_INTERVAL : float (default: 1)
+        Seconds during which ``has_pending_requests`` uses the queue length
+        counted locally from the pushes and pops of this process.
+    SCHEDULER_LEASE_TIMEOUT : float (default: 0)
+        Seconds a popped request is leased for, disabled when 0. The queue
+        leases the requests in the script popping them, prefetched ones
+        included, whose leases are renewed while they wait in the local
+        buffer. Requests not acknowledged by
+        ``scrapy_redis.lease.LeaseMiddleware`` in time are requeued.
+    SCHEDULER_LEASE_SWEEP_INTERVAL : float (default: 5)
+        Seconds between two sends of the acknowledgements and requeues of the
+        expired leases.
+    SCHEDULER_LEASE_MAX_REQUEUES : int (default: 3)
+        Number of times a request is requeued before it is dropped.
+
+    When the dupefilter supports buffering (like
+    ``scrapy_redis.dupefilter.AsyncRFPDupeFilter``), filtered requests are
+    handed to it and pushed to the queue by its worker thread.
 
     """
 
@@ -39,7 +101,15 @@ class Scheduler(object):
                  dupefilter_key=defaults.SCHEDULER_DUPEFILTER_KEY,
                  dupefilter_cls=defaults.SCHEDULER_DUPEFILTER_CLASS,
                  idle_before_close=0,
-                 serializer=None):
+                 serializer=None,
+                 queue_params=None,
+                 idle_backoff_min=defaults.SCHEDULER_IDLE_BACKOFF_MIN,
+                 idle_backoff_max=0,
+                 idle_notify=False,
+                 length_refresh_interval=defaults.SCHEDULER_LENGTH_REFRESH_INTERVAL,
+                 lease_timeout=0,
+                 lease_sweep_interval=defaults.SCHEDULER_LEASE_SWEEP_INTERVAL,
+                 lease_max_requeues=defaults.SCHEDULER_LEASE_MAX_REQUEUES):
         """Initialize scheduler.
 
         Parameters
@@ -60,6 +130,26 @@ class Scheduler(object):
             Importable path to the dupefilter class.
         idle_before_close : int
             Timeout before giving up.
+        serializer : object
+            Serializer object with ``loads`` and ``dumps`` methods.
+        queue_params : dict
+            Extra keyword arguments of the queue class.
+        idle_backoff_min : float
+            First wait in seconds after an empty pop.
+        idle_backoff_max : float
+            Longest wait in seconds between two pops of an empty queue,
+            disabled when 0 or when waiting with idle_before_close.
+        idle_notify : bool
+            Whether to publish and listen to pushes on the notify channel.
+        length_refresh_interval : float
+            Seconds between two reads of the queue length from redis by
+            ``has_pending_requests``.
+        lease_timeout : float
+            Seconds a popped request is leased for, disabled when 0.
+        lease_sweep_interval : float
+            Seconds between two sweeps of the leases.
+        lease_max_requeues : int
+            Number of times an expired request is requeued.
 
         """
         if idle_before_close < 0:
@@ -74,9 +164,28 @@ class Scheduler(object):
         self.dupefilter_key = dupefilter_key
         self.idle_before_close = idle_before_close
         self.serializer = serializer
+        self.queue_params = queue_params or {}
+        self.idle_backoff_min = idle_backoff_min
+        self.idle_backoff_max = idle_backoff_max
+        self.idle_notify = idle_notify
+        self.idle = None
+        self._notified = 0
+        self.length_refresh_interval = length_refresh_interval
+        # Approximate queue length, see has_pending_requests.
+        self._length = 0
+        self._length_checked = 0
+        self.lease_timeout = lease_timeout
+        self.lease_sweep_interval = lease_sweep_interval
+        self.lease_max_requeues = lease_max_requeues
+        self.leases = None
+        self._lease_task = None
+        self._flush_task = None
         self.stats = None
+        self.buffered = False
 
     def __len__(self):
+        if self.buffered:
+            return len(self.queue) + len(self.df)
         return len(self.queue)
 
     @classmethod
@@ -85,6 +194,17 @@ class Scheduler(object):
             'persist': settings.getbool('SCHEDULER_PERSIST'),
             'flush_on_start': settings.getbool('SCHEDULER_FLUSH_ON_START'),
             'idle_before_close': settings.getint('SCHEDULER_IDLE_BEFORE_CLOSE'),
+            'idle_backoff_min': settings.getfloat('SCHEDULER_IDLE_BACKOFF_MIN',
+                                                  defaults.SCHEDULER_IDLE_BACKOFF_MIN),
+            'idle_backoff_max': settings.getfloat('SCHEDULER_IDLE_BACKOFF_MAX'),
+            'idle_notify': settings.getbool('SCHEDULER_IDLE_NOTIFY'),
+            'length_refresh_interval': settings.getfloat('SCHEDULER_LENGTH_REFRESH_INTERVAL',
+                                                         defaults.SCHEDULER_LENGTH_REFRESH_INTERVAL),
+            'lease_timeout': settings.getfloat('SCHEDULER_LEASE_TIMEOUT'),
+            'lease_sweep_interval': settings.getfloat('SCHEDULER_LEASE_SWEEP_INTERVAL',
+                                                      defaults.SCHEDULER_LEASE_SWEEP_INTERVAL),
+            'lease_max_requeues': settings.getint('SCHEDULER_LEASE_MAX_REQUEUES',
+                                                  defaults.SCHEDULER_LEASE_MAX_REQUEUES),
         }
 
         # If these values are missing, it means we want to use the defaults.
@@ -103,9 +223,41 @@ class Scheduler(object):
             if val:
                 kwargs[name] = val
 
+        queue_params = {}
+        push_buffer_size = settings.getint('SCHEDULER_QUEUE_PUSH_BUFFER_SIZE')
+        if push_buffer_size > 1:
+            queue_params['push_buffer_size'] = push_buffer_size
+            queue_params['push_buffer_time'] = settings.getfloat(
+                'SCHEDULER_QUEUE_PUSH_BUFFER_TIME', defaults.SCHEDULER_QUEUE_PUSH_BUFFER_TIME)
+        prefetch = settings.getint('SCHEDULER_QUEUE_PREFETCH')
+        if prefetch > 1:
+            queue_params['prefetch'] = prefetch
+        shards = settings.getint('SCHEDULER_QUEUE_SHARDS')
+        if shards > 0:
+            queue_params['shards'] = shards
+            queue_params['nodes'] = connection.get_redis_nodes_from_settings(
+                settings, 'SCHEDULER_QUEUE_REDIS_NODES')
+            queue_params['shard_cls'] = settings.get('SCHEDULER_QUEUE_SHARD_CLASS',
+                                                     defaults.SCHEDULER_QUEUE_SHARD_CLASS)
+        spill_dir = settings.get('SCHEDULER_QUEUE_SPILL_DIR')
+        if spill_dir:
+            queue_params.update(
+                spill_dir=spill_dir,
+                spill_length=settings.getint('SCHEDULER_QUEUE_SPILL_LENGTH'),
+                spill_memory=settings.getint('SCHEDULER_QUEUE_SPILL_MEMORY'),
+                spill_refill=settings.getint('SCHEDULER_QUEUE_SPILL_REFILL',
+                                             defaults.SCHEDULER_QUEUE_SPILL_REFILL),
+                spill_segment_size=settings.getint('SCHEDULER_QUEUE_SPILL_SEGMENT_SIZE',
+                                                   defaults.SCHEDULER_QUEUE_SPILL_SEGMENT_SIZE),
+            )
+        if queue_params:
+            kwargs['queue_params'] = queue_params
+
         # Support serializer as a path to a module.
         if isinstance(kwargs.get('serializer'), six.string_types):
             kwargs['serializer'] = importlib.import_module(kwargs['serializer'])
+        if settings.getint('SCHEDULER_COMPRESSION_THRESHOLD') > 0:
+            kwargs['serializer'] = CompressedSerializer.from_settings(settings, kwargs.get('serializer'))
 
         server = connection.from_settings(settings)
         # Ensure the connection is working.
@@ -118,23 +270,50 @@ class Scheduler(object):
         instance = cls.from_settings(crawler.settings)
         # FIXME: for now, stats are only supported from this constructor
         instance.stats = crawler.stats
+        if instance.lease_timeout > 0:
+            crawler.signals.connect(instance._request_processed, signal=request_processed)
         return instance
 
     def open(self, spider):
         self.spider = spider
 
+        queue_params = dict(self.queue_params)
+        if self.lease_timeout > 0:
+            queue_params.update(lease_timeout=self.lease_timeout, lease_max_requeues=self.lease_max_requeues)
         try:
             self.queue = load_object(self.queue_cls)(
                 server=self.server,
                 spider=spider,
                 key=self.queue_key % {'spider': spider.name},
                 serializer=self.serializer,
+                **queue_params
             )
         except TypeError as e:
             raise ValueError("Failed to instantiate queue class '%s': %s",
                              self.queue_cls, e)
 
+        if self.queue_params.get('push_buffer_size', 0) > 1:
+            # The buffer is sent at least every push_buffer_time, even when
+            # no push or pop follows.
+            self._flush_task = task.LoopingCall(self.queue.flush)
+            self._flush_task.start(self.queue_params.get('push_buffer_time',
+                                                         defaults.SCHEDULER_QUEUE_PUSH_BUFFER_TIME), now=False)
+
         self.df = load_object(self.dupefilter_cls).from_spider(spider)
+        self.buffered = hasattr(self.df, 'defer_request')
+        if self.buffered:
+            self.df.open_buffer(self._release_requests, spider)
+
+        if self.lease_timeout > 0:
+            self.leases = self.queue.leases
+            self._lease_task = task.LoopingCall(self._sweep_leases)
+            self._lease_task.start(self.lease_sweep_interval, now=False)
+
+        self.notify_channel = '%s:notify' % (self.queue_key % {'spider': spider.name})
+        if self.idle_backoff_max > 0 and not self.idle_before_close:
+            self.idle = IdleBackoff(self.idle_backoff_min, self.idle_backoff_max,
+                                    server=self.server if self.idle_notify else None,
+                                    channels=[self.notify_channel])
 
         if self.flush_on_start:
             self.flush()
@@ -143,14 +322,43 @@ class Scheduler(object):
             spider.log("Resuming crawl (%d requests scheduled)" % len(self.queue))
 
     def close(self, reason):
+        d = defer.succeed(None)
+        if self.buffered:
+            # The requests still resolved on the dupefilter thread are pushed
+            # before the queue is closed.
+            d = self.df.close_buffer()
+        d.addCallback(lambda _: self._close(reason))
+        return d
+
+    def _close(self, reason):
+        if self.idle is not None:
+            self.idle.close()
+        if self.leases is not None:
+            if self._lease_task.running:
+                self._lease_task.stop()
+            self.leases.flush()
+        if self._flush_task is not None and self._flush_task.running:
+            self._flush_task.stop()
+        self.queue.close()
         if not self.persist:
             self.flush()
+        self.df.close(reason)
 
     def flush(self):
         self.df.clear()
         self.queue.clear()
+        if self.leases is not None:
+            self.leases.clear()
 
     def enqueue_request(self, request):
+        if self.leases is not None:
+            # Retries and redirects of a leased request replace it. The new
+            # requests copying its meta lost the lease in LeaseMiddleware.
+            self.leases.ack(request)
+        if not request.dont_filter and self.buffered:
+            # The dupefilter pushes it later if it is new.
+            self.df.defer_request(request)
+            return True
         # if not request.dont_filter and self.df.request_seen(request):
         if not request.dont_filter and self.df.request_seen_by_bloomfilter(request):
             self.df.log(request, self.spider)
@@ -158,14 +366,81 @@ class Scheduler(object):
         if self.stats:
             self.stats.inc_value('scheduler/enqueued/redis', spider=self.spider)
         self.queue.push(request)
+        self._length += 1
+        self._pushed()
         return True
 
+    def _pushed(self):
+        """Ends the idle wait of this process, and of the others when notifying"""
+        if self.idle is not None:
+            self.idle.reset()
+        now = time.time()
+        # One message a second is enough to wake the idle processes up.
+        if self.idle_notify and now - self._notified >= 1:
+            self._notified = now
+            self.server.publish(self.notify_channel, 1)
+
+    def _release_requests(self, requests):
+        """Push the new requests resolved by a buffering dupefilter.
+
+        Called on the dupefilter worker thread.
+
+        """
+        for request in requests:
+            self.queue.push(request)
+        self._length += len(requests)
+        if requests:
+            self._pushed()
+        if self.stats and requests:
+            reactor.callFromThread(self.stats.inc_value, 'scheduler/enqueued/redis',
+                                   count=len(requests), spider=self.spider)
+
     def next_request(self):
+        if self.idle is not None and not self.idle.ready():
+            return None
         block_pop_timeout = self.idle_before_close
         request = self.queue.pop(block_pop_timeout)
+        if self.idle is not None:
+            if request:
+                self.idle.reset()
+            else:
+                self.idle.empty()
+        if request:
+            self._length = max(0, self._length - 1)
         if request and self.stats:
             self.stats.inc_value('scheduler/dequeued/redis', spider=self.spider)
         return request
 
+    def _request_processed(self, request):
+        self.leases.ack(request)
+
+    def _sweep_leases(self):
+        """Send the acknowledgements and requeue the expired leases"""
+        # The prefetched requests are still held, so their leases are kept.
+        self.queue.renew_leases()
+        requests, dropped = self.leases.sweep()
+        for request in requests:
+            self.queue.push(request)
+        self._length += len(requests)
+        if self.stats:
+            if requests:
+                self.stats.inc_value('scheduler/lease/requeued/redis', count=len(requests), spider=self.spider)
+            if dropped:
+                self.stats.inc_value('scheduler/lease/dropped/redis', count=dropped, spider=self.spider)
+
     def has_pending_requests(self):
-        return len(self) > 0
+        """Returns whether requests are pending.
+
+        Called on every engine tick, so the queue length is only read from
+        redis every ``length_refresh_interval`` seconds and counted locally
+        in between. Requests pushed by other processes meanwhile are seen at
+        the next refresh.
+
+        """
+        now = time.time()
+        if now - self._length_checked >= self.length_refresh_interval:
+            self._length = len(self.queue)
+            self._length_checked = now
+        if self.buffered:
+            return self._length + len(self.df) > 0
+        return self._length > 0
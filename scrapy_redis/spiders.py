@@ -1,19 +1,26 @@
+import time
+
 from scrapy import signals
 from scrapy.exceptions import DontCloseSpider
 from scrapy.spiders import Spider, CrawlSpider
+from twisted.internet import reactor, task
 
 from . import connection, defaults
-from .utils import bytes_to_str
+from .utils import IdleBackoff, bytes_to_str
 
 
 class RedisMixin(object):
     """Mixin class to implement reading urls from a redis queue."""
     redis_key = None
     redis_batch_size = None
+    redis_batch_size_max = None
     redis_encoding = None
+    redis_as_zset = None
 
     # Redis client placeholder.
     server = None
+    idle_backoff = None
+    redis_topup_task = None
 
     def start_requests(self):
         """Returns a batch of start requests from redis."""
@@ -55,14 +62,28 @@ class RedisMixin(object):
                 settings.getint('CONCURRENT_REQUESTS'),
             )
 
+        if self.redis_batch_size_max is None:
+            self.redis_batch_size_max = settings.getint('REDIS_START_URLS_BATCH_SIZE_MAX')
+
         try:
             self.redis_batch_size = int(self.redis_batch_size)
+            self.redis_batch_size_max = int(self.redis_batch_size_max)
         except (TypeError, ValueError):
-            raise ValueError("redis_batch_size must be an integer")
+            raise ValueError("redis_batch_size and redis_batch_size_max must be integers")
+
+        # Batch size tuned between redis_batch_size and redis_batch_size_max.
+        self.redis_batch_size_current = self.redis_batch_size
+        self.redis_batch_interval = settings.getfloat('REDIS_START_URLS_BATCH_INTERVAL',
+                                                      defaults.START_URLS_BATCH_INTERVAL)
+        self._last_fetch = None
+        self._last_found = 0
 
         if self.redis_encoding is None:
             self.redis_encoding = settings.get('REDIS_ENCODING', defaults.REDIS_ENCODING)
 
+        if self.redis_as_zset is None:
+            self.redis_as_zset = settings.getbool('REDIS_START_URLS_AS_ZSET', defaults.START_URLS_AS_ZSET)
+
         self.logger.info("Reading start URLs from redis key '%(redis_key)s' "
                          "(batch size: %(redis_batch_size)s, encoding: %(redis_encoding)s",
                          self.__dict__)
@@ -72,25 +93,86 @@ class RedisMixin(object):
         # that's when we will schedule new requests from redis queue
         crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
 
+        backoff_max = settings.getfloat('REDIS_START_URLS_BACKOFF_MAX')
+        if backoff_max > 0:
+            channels = []
+            if settings.getbool('REDIS_START_URLS_NOTIFY'):
+                db = self.server.connection_pool.connection_kwargs.get('db', 0)
+                # Published by the seed loaders, and by redis itself when its
+                # keyspace notifications are enabled.
+                channels = ['%s:notify' % self.redis_key, '__keyspace@%s__:%s' % (db, self.redis_key)]
+            self.idle_backoff = IdleBackoff(
+                settings.getfloat('REDIS_START_URLS_BACKOFF_MIN', defaults.START_URLS_BACKOFF_MIN),
+                backoff_max, server=self.server, channels=channels,
+                on_notify=lambda: reactor.callFromThread(self.schedule_next_requests),
+            )
+            crawler.signals.connect(self.idle_backoff.close, signal=signals.spider_closed)
+
+        topup_interval = settings.getfloat('REDIS_START_URLS_TOPUP_INTERVAL')
+        if topup_interval > 0:
+            self.redis_topup_interval = topup_interval
+            self.redis_topup_ratio = settings.getfloat('REDIS_START_URLS_TOPUP_RATIO', defaults.START_URLS_TOPUP_RATIO)
+            self.redis_topup_task = task.LoopingCall(self.top_up)
+            crawler.signals.connect(self._start_top_up, signal=signals.spider_opened)
+            crawler.signals.connect(self._stop_top_up, signal=signals.spider_closed)
+
+    def fetch_data(self, count):
+        """Removes and returns up to count messages in one round trip.
+
+        With ``redis_as_zset``, the messages are (member, score) pairs, the
+        highest scores first.
+
+        """
+        if count <= 0:
+            return []
+        if self.redis_as_zset:
+            # ZPOPMAX needs redis 5.0.
+            pipe = self.server.pipeline()
+            pipe.zrevrange(self.redis_key, 0, count - 1, withscores=True)
+            pipe.zremrangebyrank(self.redis_key, -count, -1)
+            return pipe.execute()[0]
+        if self.settings.getbool('REDIS_START_URLS_AS_SET', defaults.START_URLS_AS_SET):
+            return self.server.spop(self.redis_key, count) or []
+        # LPOP with a count needs redis 6.2.
+        pipe = self.server.pipeline()
+        pipe.lrange(self.redis_key, 0, count - 1)
+        pipe.ltrim(self.redis_key, count, -1)
+        return pipe.execute()[0]
+
+    def tune_batch_size(self):
+        """Sizes the next batch to last redis_batch_interval at the current rate.
+
+        The rate is the number of requests of the last batch over the time
+        since it was fetched, which is how long the spider took to drain it
+        when batches are fetched on idle.
+
+        """
+        now = time.time()
+        if self.redis_batch_size_max > self.redis_batch_size and self._last_found and self._last_fetch:
+            rate = self._last_found / max(now - self._last_fetch, 1e-3)
+            self.redis_batch_size_current = int(min(self.redis_batch_size_max,
+                                                    max(self.redis_batch_size, rate * self.redis_batch_interval)))
+        self._last_fetch = now
+
     def next_requests(self):
         """Returns a request to be scheduled or none."""
-        use_set = self.settings.getbool('REDIS_START_URLS_AS_SET', defaults.START_URLS_AS_SET)
-        fetch_one = self.server.spop if use_set else self.server.lpop
-        # XXX: Do we need to use a timeout here?
+        self.tune_batch_size()
         found = 0
-        # TODO: Use redis pipeline execution.
-        while found < self.redis_batch_size:
-            data = fetch_one(self.redis_key)
-            if not data:
-                # Queue empty.
-                break
+        for data in self.fetch_data(self.redis_batch_size_current):
+            score = None
+            if self.redis_as_zset:
+                data, score = data
             req = self.make_request_from_data(data)
             if req:
+                if score is not None:
+                    # Scheduled before the requests of lower scores.
+                    req.priority = int(score)
                 yield req
                 found += 1
             else:
                 self.logger.debug("Request not made from data: %r", data)
 
+        self._last_found = found
         if found:
             self.logger.debug("Read %s requests from '%s'", found, self.redis_key)
 
@@ -110,15 +192,49 @@ class RedisMixin(object):
         return self.make_requests_from_url(url)
 
     def schedule_next_requests(self):
-        """Schedules a request if available"""
-        # TODO: While there is capacity, schedule a batch of redis requests.
+        """Schedules a request if available, returns the number of requests"""
+        found = 0
         for req in self.next_requests():
             self.crawler.engine.crawl(req, spider=self)
+            found += 1
+        if self.idle_backoff is not None:
+            if found:
+                self.idle_backoff.reset()
+            else:
+                self.idle_backoff.empty()
+        return found
+
+    def has_capacity(self):
+        """Returns whether the crawl is about to run out of requests.
+
+        That is when the scheduler has no pending requests and the downloader
+        is below ``redis_topup_ratio`` of its concurrency.
+
+        """
+        engine = self.crawler.engine
+        slot = getattr(engine, 'slot', None)
+        if slot is None or slot.closing or slot.scheduler.has_pending_requests():
+            return False
+        downloader = engine.downloader
+        return len(downloader.active) < downloader.total_concurrency * self.redis_topup_ratio
+
+    def top_up(self):
+        """Schedules start requests before the crawl runs dry."""
+        if self.has_capacity() and (self.idle_backoff is None or self.idle_backoff.ready()):
+            self.schedule_next_requests()
+
+    def _start_top_up(self):
+        self.redis_topup_task.start(self.redis_topup_interval, now=False)
+
+    def _stop_top_up(self):
+        if self.redis_topup_task.running:
+            self.redis_topup_task.stop()
 
     def spider_idle(self):
         """Schedules a request if available, otherwise waits."""
         # XXX: Handle a sentinel to close the spider.
-        self.schedule_next_requests()
+        if self.idle_backoff is None or self.idle_backoff.ready():
+            self.schedule_next_requests()
         raise DontCloseSpider
 
 
@@ -131,8 +247,12 @@ class RedisSpider(RedisMixin, Spider):
         Redis key where to fetch start URLs from..
     redis_batch_size : int (default: CONCURRENT_REQUESTS)
         Number of messages to fetch from redis on each attempt.
+    redis_batch_size_max : int (default: REDIS_START_URLS_BATCH_SIZE_MAX)
+        Largest batch when the batch size is tuned.
     redis_encoding : str (default: REDIS_ENCODING)
         Encoding to use when decoding messages from redis queue.
+    redis_as_zset : bool (default: REDIS_START_URLS_AS_ZSET)
+        Read the start URLs from a sorted set.
 
     Settings
     --------
@@ -140,9 +260,32 @@ class RedisSpider(RedisMixin, Spider):
         Default Redis key where to fetch start URLs from..
     REDIS_START_URLS_BATCH_SIZE : int (deprecated by CONCURRENT_REQUESTS)
         Default number of messages to fetch from redis on each attempt.
+    REDIS_START_URLS_BATCH_SIZE_MAX : int (default: 0)
+        When larger than the batch size, the batch size is tuned up to it so
+        that a batch lasts REDIS_START_URLS_BATCH_INTERVAL seconds.
+    REDIS_START_URLS_BATCH_INTERVAL : float (default: 5)
+        Seconds of crawling a tuned batch is sized for.
     REDIS_START_URLS_AS_SET : bool (default: False)
         Use SET operations to retrieve messages from the redis queue. If False,
         the messages are retrieve using the LPOP command.
+    REDIS_START_URLS_AS_ZSET : bool (default: False)
+        Retrieve the messages from a sorted set, highest scores first, and
+        use the integer part of their score as the request priority. Takes
+        precedence over REDIS_START_URLS_AS_SET.
+    REDIS_START_URLS_TOPUP_INTERVAL : float (default: 0)
+        Seconds between two checks of the crawl capacity, to schedule start
+        URLs before the spider is idle. Disabled when 0.
+    REDIS_START_URLS_TOPUP_RATIO : float (default: 0.5)
+        Share of the downloader concurrency below which start URLs are
+        scheduled, when the scheduler has no pending requests.
+    REDIS_START_URLS_BACKOFF_MAX : float (default: 0)
+        Longest wait in seconds between two reads of an empty start URLs
+        key when idle. Disabled when 0.
+    REDIS_START_URLS_BACKOFF_MIN : float (default: 0.5)
+        First wait in seconds after an empty read.
+    REDIS_START_URLS_NOTIFY : bool (default: False)
+        End the wait on a message on ``<redis_key>:notify`` or a keyspace
+        notification of the start URLs key.
     REDIS_ENCODING : str (default: "utf-8")
         Default encoding to use when decoding messages from redis queue.
 
@@ -164,8 +307,12 @@ class RedisCrawlSpider(RedisMixin, CrawlSpider):
         Redis key where to fetch start URLs from..
     redis_batch_size : int (default: CONCURRENT_REQUESTS)
         Number of messages to fetch from redis on each attempt.
+    redis_batch_size_max : int (default: REDIS_START_URLS_BATCH_SIZE_MAX)
+        Largest batch when the batch size is tuned.
     redis_encoding : str (default: REDIS_ENCODING)
         Encoding to use when decoding messages from redis queue.
+    redis_as_zset : bool (default: REDIS_START_URLS_AS_ZSET)
+        Read the start URLs from a sorted set.
 
     Settings
     --------
@@ -173,8 +320,31 @@ class RedisCrawlSpider(RedisMixin, CrawlSpider):
         Default Redis key where to fetch start URLs from..
     REDIS_START_URLS_BATCH_SIZE : int (deprecated by CONCURRENT_REQUESTS)
         Default number of messages to fetch from redis on each attempt.
+    REDIS_START_URLS_BATCH_SIZE_MAX : int (default: 0)
+        When larger than the batch size, the batch size is tuned up to it so
+        that a batch lasts REDIS_START_URLS_BATCH_INTERVAL seconds.
+    REDIS_START_URLS_BATCH_INTERVAL : float (default: 5)
+        Seconds of crawling a tuned batch is sized for.
     REDIS_START_URLS_AS_SET : bool (default: True)
         Use SET operations to retrieve messages from the redis queue.
+    REDIS_START_URLS_AS_ZSET : bool (default: False)
+        Retrieve the messages from a sorted set, highest scores first, and
+        use the integer part of their score as the request priority. Takes
+        precedence over REDIS_START_URLS_AS_SET.
+    REDIS_START_URLS_TOPUP_INTERVAL : float (default: 0)
+        Seconds between two checks of the crawl capacity, to schedule start
+        URLs before the spider is idle. Disabled when 0.
+    REDIS_START_URLS_TOPUP_RATIO : float (default: 0.5)
+        Share of the downloader concurrency below which start URLs are
+        scheduled, when the scheduler has no pending requests.
+    REDIS_START_URLS_BACKOFF_MAX : float (default: 0)
+        Longest wait in seconds between two reads of an empty start URLs
+        key when idle. Disabled when 0.
+    REDIS_START_URLS_BACKOFF_MIN : float (default: 0.5)
+        First wait in seconds after an empty read.
+    REDIS_START_URLS_NOTIFY : bool (default: False)
+        End the wait on a message on ``<redis_key>:notify`` or a keyspace
+        notification of the start URLs key.
     REDIS_ENCODING : str (default: "utf-8")
         Default encoding to use when decoding messages from redis queue.
 
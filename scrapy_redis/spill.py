@@ -0,0 +1,224 @@
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import cPickle as pickle  # PY2
+except ImportError:
+    import pickle
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+RECORD = struct.Struct('>I')
+
+
+class SegmentLog(object):
+    """Local append-only log of queue items, read back in order.
+
+    Items are appended to the last segment file of the directory and read
+    from the first one through a memory map. A segment is deleted once read,
+    and the read position is kept in a file so a restarted crawler resumes
+    where it stopped.
+
+    Each process locks its own numbered subdirectory of the directory, so the
+    crawlers of a host do not share segments, and a restarted crawler takes
+    over the segments of a stopped one. Without ``fcntl`` the subdirectory is
+    named after the process id.
+
+    """
+
+    def __init__(self, path, segment_size=64 << 20):
+        """Initialize the log.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the segment subdirectories, created if needed.
+        segment_size : int
+            Bytes after which a new segment file is started.
+
+        """
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self.path = path = self._claim(path)
+        self.segment_size = segment_size
+        self.offset_path = os.path.join(path, 'offset')
+        self._writer = None
+        self._readers = {}
+        # Position after the items returned by read, until commit.
+        self._pending = None
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith('.seg'))
+        self.offset = 0
+        if self.segments and os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                self.offset = int(f.read() or 0)
+        self.count = sum(self._count(segment) for segment in self.segments)
+
+    def __len__(self):
+        return self.count
+
+    def _claim(self, path):
+        """Return the first subdirectory of path not locked by another process"""
+        if fcntl is None:
+            path = os.path.join(path, str(os.getpid()))
+            _makedirs(path)
+            return path
+        _makedirs(path)
+        existing = sorted(int(name) for name in os.listdir(path) if name.isdigit())
+        # The subdirectories holding segments first, so none is left behind.
+        existing.sort(key=lambda index: not any(name.endswith('.seg')
+                                                for name in os.listdir(os.path.join(path, str(index)))))
+        for index in existing + list(range(max(existing or [-1]) + 1, 1 << 16)):
+            claimed = os.path.join(path, str(index))
+            _makedirs(claimed)
+            lock_file = open(os.path.join(claimed, 'lock'), 'a')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            return claimed
+        raise ValueError("no free spill directory in %s" % path)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, '%020d.seg' % segment)
+
+    def _count(self, segment):
+        count = 0
+        with open(self._segment_path(segment), 'rb') as f:
+            if segment == self.segments[0]:
+                f.seek(self.offset)
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return count
+                # A record torn by a crash is counted, and skipped by read.
+                f.seek(RECORD.unpack(header)[0], os.SEEK_CUR)
+                count += 1
+
+    def append(self, items):
+        """Append items to the last segment"""
+        if not items:
+            return
+        records = []
+        for item in items:
+            record = pickle.dumps(item, protocol=-1)
+            records.append(RECORD.pack(len(record)))
+            records.append(record)
+        with self._lock:
+            if self._writer is None or self._writer.tell() >= self.segment_size:
+                self._seal()
+                self.segments.append(self.segments[-1] + 1 if self.segments else 0)
+                self._writer = open(self._segment_path(self.segments[-1]), 'ab')
+            self._writer.write(b''.join(records))
+            self._writer.flush()
+            self.count += len(items)
+
+    def _seal(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _map(self, index):
+        """Return a memory map of the segment at index, None if it is empty"""
+        segment = self.segments[index]
+        if segment not in self._readers:
+            if self._writer is not None and index == len(self.segments) - 1:
+                # The segment being written is only read once closed.
+                self._seal()
+            with open(self._segment_path(segment), 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    # Left by a crash before the first write.
+                    return None
+                self._readers[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._readers[segment]
+
+    def read(self, count):
+        """Return up to count items from the first segments.
+
+        The items are removed by ``commit``, until then the next read returns
+        them again.
+
+        """
+        items = []
+        torn = 0
+        with self._lock:
+            index, offset = 0, self.offset
+            while len(items) < count and len(items) + torn < self.count and index < len(self.segments):
+                reader = self._map(index)
+                if reader is not None:
+                    while len(items) < count and offset < len(reader):
+                        size = RECORD.unpack_from(reader, offset)[0]
+                        start = offset + RECORD.size
+                        if start + size > len(reader):
+                            # Torn by a crash while it was written.
+                            torn += 1
+                            offset = len(reader)
+                            break
+                        items.append(pickle.loads(reader[start:start + size]))
+                        offset = start + size
+                if reader is None or offset >= len(reader):
+                    index += 1
+                    offset = 0
+            self._pending = (index, offset, len(items) + torn)
+        return items
+
+    def commit(self):
+        """Remove the items returned by the last read"""
+        with self._lock:
+            if self._pending is None:
+                return
+            index, offset, count = self._pending
+            self._pending = None
+            for segment in self.segments[:index]:
+                reader = self._readers.pop(segment, None)
+                if reader is not None:
+                    reader.close()
+                os.remove(self._segment_path(segment))
+            del self.segments[:index]
+            self.offset = offset
+            self.count -= count
+            with open(self.offset_path, 'w') as f:
+                f.write(str(self.offset))
+
+    def _close_files(self):
+        self._seal()
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        self._pending = None
+
+    def close(self):
+        """Close the files and release the directory"""
+        with self._lock:
+            self._close_files()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def clear(self):
+        """Delete all the segments"""
+        with self._lock:
+            self._close_files()
+            for segment in self.segments:
+                os.remove(self._segment_path(segment))
+            self.segments = []
+            self.offset = 0
+            self.count = 0
+            if os.path.exists(self.offset_path):
+                os.remove(self.offset_path)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        # Created meanwhile by another process.
+        if not os.path.isdir(path):
+            raise
@@ -1,3 +1,5 @@
+import time
+
 import six
 
 
@@ -6,3 +8,68 @@ def bytes_to_str(s, encoding='utf-8'):
     if six.PY3 and isinstance(s, bytes):
         return s.decode(encoding)
     return s
+
+
+class IdleBackoff(object):
+    """Exponential backoff of the polls of an empty redis queue.
+
+    Each empty poll doubles the wait before the next one, from min_interval
+    up to max_interval, and a poll that finds work resets it. When channels
+    are given, a message published on one of them resets it too, from a
+    pubsub thread.
+
+    """
+
+    def __init__(self, min_interval=0.5, max_interval=30, server=None, channels=(), on_notify=None):
+        """Initialize the backoff.
+
+        Parameters
+        ----------
+        min_interval : float
+            Seconds waited after the first empty poll.
+        max_interval : float
+            Longest wait in seconds.
+        server : StrictRedis, optional
+            Redis client instance subscribed to the channels.
+        channels : list of str
+            Channels notified when work is added.
+        on_notify : callable, optional
+            Called on the pubsub thread after a notification reset the
+            backoff.
+
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.on_notify = on_notify
+        self.interval = 0
+        self.next_poll = 0
+        self._thread = None
+        if server is not None and channels:
+            pubsub = server.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**dict((channel, self._notified) for channel in channels))
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _notified(self, message):
+        backing_off = self.interval > 0
+        self.reset()
+        if backing_off and self.on_notify is not None:
+            self.on_notify()
+
+    def ready(self):
+        """Returns whether to poll now."""
+        return time.time() >= self.next_poll
+
+    def empty(self):
+        """Backs off after an empty poll."""
+        self.interval = min(self.max_interval, max(self.min_interval, self.interval * 2))
+        self.next_poll = time.time() + self.interval
+
+    def reset(self):
+        """Polls again right away."""
+        self.interval = 0
+        self.next_poll = 0
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
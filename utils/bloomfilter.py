@@ -1,48 +1,267 @@
+import math
+import mmap
+import os
+import struct
+import time
+from binascii import unhexlify
 from hashlib import md5
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-class SimpleHash(object):
+
+class Digest(str):
     """
-        SimpleHash class to implement hash function of bloom filter.
+        Digest class to mark data that is already a md5 hex digest, bloom filters use it as it is
+        instead of hashing it again.
     """
 
-    def __init__(self, capacity, seed):
+
+class DoubleHash(object):
+    """
+        DoubleHash class to derive all hash functions of bloom filter from one md5 digest.
+
+        The 128 bit digest is split into two 64 bit halves h1 and h2, and the i-th offset is
+        (h1 + i * h2) mod capacity (Kirsch and Mitzenmacher), which keeps the false positive
+        rate of k independent hash functions while hashing the value only once.
+    """
+
+    MASK = (1 << 64) - 1
+
+    # numpy only pays off once its per call overhead is spread over enough digests.
+    NUMPY_THRESHOLD = 32
+
+    def __init__(self, capacity, hash_num):
         """
             Parameters:
             -----------
             capacity: integer
                 the maximum bit digits.
-            seed: integer
-                the seed is different param in the each hash function.
+            hash_num: integer
+                the number of hash functions.
         """
         self.capacity = capacity
-        self.seed = seed
+        self.hash_num = hash_num
 
-    def hash(self, value):
+    def hash(self, digest):
         """
-            function hash() implement to acquire hash value that use simply method that weighted sum.
+            function hash() implement to acquire all bit offsets of one md5 hex digest.
 
             Parameters:
             -----------
-            value: string
-                the value is param of need acquire hash
+            digest: string
+                32 characters md5 hex digest
             Returns:
             --------
             result
-                hash code for value
+                list of hash_num bit offsets
+        """
+        h1 = int(digest[:16], 16)
+        # force h2 odd so the offsets never collapse to a single bit
+        h2 = int(digest[16:32], 16) | 1
+        return [((h1 + i * h2) & self.MASK) % self.capacity for i in range(self.hash_num)]
+
+    def hash_many(self, digests):
+        """
+            function hash_many() implement to acquire bit offsets of a batch of md5 hex digests.
+
+            It is vectorized by numpy when numpy is installed and the batch is big enough, the
+            result is the same as calling hash() on each digest.
+        """
+        if np is None or len(digests) < self.NUMPY_THRESHOLD:
+            return [self.hash(digest) for digest in digests]
+        halves = np.frombuffer(unhexlify(''.join(digests)), dtype='>u8').reshape(-1, 2).astype(np.uint64)
+        h1 = halves[:, 0:1]
+        h2 = halves[:, 1:2] | np.uint64(1)
+        seq = np.arange(self.hash_num, dtype=np.uint64)
+        # uint64 arithmetic wraps around like the 64 bit mask of hash()
+        with np.errstate(over='ignore'):
+            offsets = (h1 + seq * h2) % np.uint64(self.capacity)
+        return offsets.tolist()
+
+
+# the string of redis maximum size is 512MB
+MAX_BIT_SIZE = 1 << 32
+
+# data are routed to blocks by the first byte of their digest
+MAX_BLOCK_NUM = 256
+
+# snapshot file layout: magic, header of bit_size, hash_num, block_num, then records of
+# block index, byte offset, length and the bytes, closed by a record of block index END_BLOCK
+SNAPSHOT_MAGIC = b'RBFS'
+SNAPSHOT_HEADER = struct.Struct('>QII')
+SNAPSHOT_RECORD = struct.Struct('>IQI')
+SNAPSHOT_END_BLOCK = 0xFFFFFFFF
+
+
+def optimal_size(capacity, error_rate):
+    """
+        Compute the bit size and hash number that keep error_rate after capacity insertions.
+
+        Parameters:
+        -----------
+        capacity: integer
+            the expected number of inserted values.
+        error_rate: float
+            the target false positive rate, between 0 and 1.
+        Returns:
+        --------
+        result
+            tuple of (bit_size, hash_num)
+    """
+    if capacity <= 0:
+        raise ValueError("capacity must be positive: %r" % capacity)
+    if not 0 < error_rate < 1:
+        raise ValueError("error_rate must be between 0 and 1: %r" % error_rate)
+    bit_size = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    hash_num = max(1, int(round(float(bit_size) / capacity * math.log(2))))
+    return bit_size, hash_num
+
+
+def found_in_any(lookups, count):
+    """
+        Judge a batch of data against several RedisBloomFilter with one pipelined round trip
+        per redis node.
+
+        Parameters:
+        -----------
+        lookups: iterable
+            tuples of (RedisBloomFilter, position of the data, block number, bit offsets)
+        count: integer
+            number of data
+        Returns:
+        --------
+        result
+            list of bool by position, True if all bits of any lookup of the position are 1
+    """
+    pipes = []
+    for bloomfilter, position, block, offsets in lookups:
+        name = bloomfilter.key + str(block)
+        server = bloomfilter.server_for(name)
+        for pipe_server, pipe, entries in pipes:
+            if pipe_server is server:
+                break
+        else:
+            pipe, entries = server.pipeline(transaction=False), []
+            pipes.append((server, pipe, entries))
+        for offset in offsets:
+            pipe.getbit(name, offset)
+        entries.append((position, len(offsets)))
+    found = [False] * count
+    for server, pipe, entries in pipes:
+        bits = pipe.execute()
+        start = 0
+        for position, length in entries:
+            if all(bits[start:start + length]):
+                found[position] = True
+            start += length
+    return found
+
+
+class BaseBloomFilter(object):
+    """
+        BaseBloomFilter class to define the interface of bloom filters.
+
+        Subclasses implement the batch methods contains_many() and add_many(), the single
+        value methods are derived from them.
+    """
+
+    def is_contains(self, data):
+        """
+            Judge the data whether is already exist if each bit of hash code is 1 then data exist.
+        """
+        if not data:
+            return False
+        return self.contains_many([data])[0]
+
+    def insert(self, data):
+        """
+            Insert 1 into each bit
+        """
+        if not data:
+            return
+        self.add_many([data])
+
+    def add(self, data):
+        """
+            Insert data and judge whether it was already exist.
+
+            Parameters:
+            -----------
+            data: string
+                the value need to check and insert
+            Returns:
+            --------
+            result
+                True if data was already exist before this call
+        """
+        if not data:
+            return False
+        return self.add_many([data])[0]
+
+    def contains_many(self, data_list):
+        """
+            Judge a batch of data, returns list of bool in the same order as data_list.
+        """
+        raise NotImplementedError
+
+    def add_many(self, data_list):
+        """
+            Insert a batch of data, returns list of bool in the same order as data_list,
+            True if it was already exist.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+            Remove all the inserted data.
         """
-        result = 0
-        for i in range(len(value)):
-            result += self.seed * result + ord(value[i])
-        return (self.capacity - 1) % result
+        raise NotImplementedError
 
+    def close(self):
+        """
+            Release the resources held by the filter.
+        """
 
-class RedisBloomFilter(object):
+    def _compress_by_md5(self, data):
+        if isinstance(data, Digest):
+            return data
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        md_5 = md5()
+        md_5.update(data)
+        return md_5.hexdigest()
+
+
+class RedisBloomFilter(BaseBloomFilter):
     """
         RedisBloomFilter class to implement url filter by bloom filter in the string of redis.
     """
 
-    def __init__(self, server, key, block_num=1):
+    # SETBIT the offsets of ARGV[3:] in block KEYS[1], ARGV[1] per data, and add the number of
+    # new data to field ARGV[2] of hash KEYS[2], returns the previous bits and the new count
+    add_counted_script = """
+    local hash_num = tonumber(ARGV[1])
+    local bits = {}
+    local added = 0
+    for i = 3, #ARGV, hash_num do
+        local exist = 1
+        for j = i, i + hash_num - 1 do
+            local bit = redis.call('SETBIT', KEYS[1], ARGV[j], 1)
+            table.insert(bits, bit)
+            if bit == 0 then
+                exist = 0
+            end
+        end
+        added = added + 1 - exist
+    end
+    table.insert(bits, redis.call('HINCRBY', KEYS[2], ARGV[2], added))
+    return bits
+    """
+
+    def __init__(self, server, key, block_num=1, bit_size=1 << 31, hash_num=9, ring=None, expire_at=None):
         """
             Parameters:
             -----------
@@ -52,45 +271,677 @@ class RedisBloomFilter(object):
                 Redis key name
             blocK_num
                 block number
+            bit_size
+                bit number of each block, default use 256MB
+            hash_num
+                the number of hash function
+            ring
+                HashRing of redis client instances, the blocks are spread over its nodes by
+                consistent hashing of the block key, default put all blocks on server
+            expire_at
+                unix time at which the blocks expire, set by every insert, default never
         """
-        self.seeds = [5, 7, 11, 13, 31, 37, 61, 79, 97]  # the seeds for number of hash function
-        self.bit_size = 1 << 31  # use 256MB because the string of redis maximum size is 512MB
+        if not 0 < bit_size <= MAX_BIT_SIZE:
+            raise ValueError("bit_size must be between 1 and %d: %r" % (MAX_BIT_SIZE, bit_size))
+        self.hash_num = hash_num
+        self.bit_size = bit_size
         self.server = server
         self.key = key
         self.block_num = block_num
-        self.hash_function = []
-        for seed in self.seeds:
-            self.hash_function.append(SimpleHash(self.bit_size, seed))
+        self.ring = ring
+        self.expire_at = expire_at
+        self.hash_function = DoubleHash(self.bit_size, self.hash_num)
+        self._add_counted = None
 
-    def is_contains(self, data):
+    @classmethod
+    def from_capacity(cls, server, key, capacity, error_rate, block_num=1, ring=None):
         """
-            Judge the data whether is already exist if each bit of hash code is 1 then data exist.
+            Returns a filter sized to hold capacity values with the false positive rate error_rate.
+
+            The values spread evenly over the blocks, so each block is sized for its share.
         """
-        if not data:
-            return False
-        data = self._compress_by_md5(data)
-        result = True
-        # cut the first two place,route to different block by block_num
-        name = self.key + str(int(data[0:2], 16) % self.block_num)
-        for h in self.hash_function:
-            local_hash = h.hash(data)
-            result = result & self.server.getbit(name, local_hash)
-        return result
+        bit_size, hash_num = optimal_size(int(math.ceil(float(capacity) / block_num)), error_rate)
+        if bit_size > MAX_BIT_SIZE:
+            raise ValueError("capacity %d needs %d bits per block, more than the redis limit %d, "
+                             "use more blocks" % (capacity, bit_size, MAX_BIT_SIZE))
+        return cls(server, key, block_num=block_num, bit_size=bit_size, hash_num=hash_num, ring=ring)
 
-    def insert(self, data):
+    def contains_many(self, data_list):
         """
-            Insert 1 into each bit
+            Judge a batch of data with one pipelined round trip per block key.
+
+            Parameters:
+            -----------
+            data_list: list
+                the values need to check
+            Returns:
+            --------
+            result
+                list of bool in the same order as data_list
         """
-        if not data:
-            return
-        data = self._compress_by_md5(data)
+        return self._execute_many(data_list, insert=False)
+
+    def add_many(self, data_list):
+        """
+            Insert a batch of data and judge whether each one was already exist.
+
+            SETBIT replies with the previous value of the bit, so a value already existed only
+            if every previous bit was 1. Each block key gets one MULTI/EXEC pipeline of SETBIT,
+            other clients can not interleave between the commands, so two crawler nodes never
+            both see the same value as new, and a value repeated inside the batch is reported
+            as exist from its second occurrence.
+
+            Parameters:
+            -----------
+            data_list: list
+                the values need to check and insert
+            Returns:
+            --------
+            result
+                list of bool in the same order as data_list, True if it was already exist
+        """
+        return self._execute_many(data_list, insert=True)
+
+    def add_many_counted(self, data_list, counter_key, field):
+        """
+            Insert a batch of data like add_many(), and add the number of new data to field of the
+            redis hash counter_key on server.
+
+            The blocks on server are written by a script that also increments the counter, so
+            the count costs no extra round trip, the blocks on other nodes of the ring by
+            MULTI/EXEC pipelines followed by one HINCRBY.
+
+            Parameters:
+            -----------
+            data_list: list
+                the values need to check and insert
+            counter_key
+                Redis key name of the hash on server
+            field
+                field of the hash
+            Returns:
+            --------
+            result
+                tuple of the list of bool like add_many() and the value of the counter after
+                the insert
+        """
+        return self._execute_many(data_list, insert=True, counter=(counter_key, field))
+
+    def keys(self):
+        """
+            Returns the redis key names of all the blocks.
+        """
+        return [self.key + str(i) for i in range(self.block_num)]
+
+    def server_for(self, name):
+        """
+            Returns the redis client instance holding block key name.
+        """
+        if self.ring is None:
+            return self.server
+        return self.ring.get_node(name)
+
+    def group_by_server(self, names):
+        """
+            Returns list of (redis client instance, key names it holds).
+        """
+        groups = []
+        for name in names:
+            server = self.server_for(name)
+            for group_server, group_names in groups:
+                if group_server is server:
+                    group_names.append(name)
+                    break
+            else:
+                groups.append((server, [name]))
+        return groups
+
+    def clear(self):
+        for server, names in self.group_by_server(self.keys()):
+            server.delete(*names)
+
+    def dump(self, fileobj, chunk_size=1 << 20, depth=16):
+        """
+            Write the bits of all blocks to a binary file object.
+
+            Blocks are read by GETRANGE chunks of chunk_size bytes, depth chunks per pipelined
+            round trip, and chunks of all zero bytes are skipped. Wrap fileobj in gzip to
+            compress the snapshot.
+
+            Parameters:
+            -----------
+            fileobj
+                binary file object opened for writing
+            chunk_size
+                bytes of each GETRANGE
+            depth
+                number of GETRANGE of each round trip
+            Returns:
+            --------
+            result
+                number of bitmap bytes written
+        """
+        fileobj.write(SNAPSHOT_MAGIC + SNAPSHOT_HEADER.pack(self.bit_size, self.hash_num, self.block_num))
+        written = 0
+        step = chunk_size * depth
+        for block, name in enumerate(self.keys()):
+            pipe = self.server_for(name).pipeline(transaction=False)
+            length = pipe.strlen(name).execute()[0]
+            for start in range(0, length, step):
+                offsets = range(start, min(start + step, length), chunk_size)
+                for offset in offsets:
+                    pipe.getrange(name, offset, offset + chunk_size - 1)
+                for offset, chunk in zip(offsets, pipe.execute()):
+                    if chunk.strip(b'\x00'):
+                        fileobj.write(SNAPSHOT_RECORD.pack(block, offset, len(chunk)))
+                        fileobj.write(chunk)
+                        written += len(chunk)
+        fileobj.write(SNAPSHOT_RECORD.pack(SNAPSHOT_END_BLOCK, 0, 0))
+        return written
+
+    def load(self, fileobj, depth=16):
+        """
+            Replace the bits of all blocks by a snapshot written by dump().
+
+            The snapshot must have the same bit size, hash number and block number, the chunks
+            are written by SETRANGE, depth chunks per pipelined round trip.
+
+            Parameters:
+            -----------
+            fileobj
+                binary file object opened for reading
+            depth
+                number of SETRANGE of each round trip
+            Returns:
+            --------
+            result
+                number of bitmap bytes loaded
+        """
+        magic = fileobj.read(len(SNAPSHOT_MAGIC))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("not a bloomfilter snapshot: %r" % magic)
+        header = SNAPSHOT_HEADER.unpack(fileobj.read(SNAPSHOT_HEADER.size))
+        if header != (self.bit_size, self.hash_num, self.block_num):
+            raise ValueError("snapshot of bit_size %d, hash_num %d, block_num %d does not match "
+                             "the filter" % header)
+
+        keys = self.keys()
+        self.clear()
+        pipe = None
+        current = None
+        pending = 0
+        loaded = 0
+        while True:
+            block, offset, length = SNAPSHOT_RECORD.unpack(fileobj.read(SNAPSHOT_RECORD.size))
+            if block == SNAPSHOT_END_BLOCK:
+                break
+            chunk = fileobj.read(length)
+            if len(chunk) != length:
+                raise ValueError("truncated bloomfilter snapshot")
+            if block != current:
+                if pipe is not None:
+                    pipe.execute()
+                pipe = self.server_for(keys[block]).pipeline(transaction=False)
+                current = block
+                pending = 0
+            pipe.setrange(keys[block], offset, chunk)
+            loaded += length
+            pending += 1
+            if pending >= depth:
+                pipe.execute()
+                pending = 0
+        if pipe is not None:
+            pipe.execute()
+        return loaded
+
+    def _execute_many(self, data_list, insert, counter=None):
+        results = [False] * len(data_list)
+        indexes = [index for index, data in enumerate(data_list) if data]
+        blocks = {}
+        for index, (block, offsets) in zip(indexes, self._locate_many([data_list[i] for i in indexes])):
+            blocks.setdefault(self.key + str(block), []).append((index, offsets))
+
+        count = None
+        uncounted = 0
+        for name, entries in blocks.items():
+            server = self.server_for(name)
+            if counter is not None and server is self.server:
+                if self._add_counted is None:
+                    self._add_counted = server.register_script(self.add_counted_script)
+                args = [self.hash_num, counter[1]]
+                for index, offsets in entries:
+                    args.extend(offsets)
+                bits = self._add_counted(keys=[name, counter[0]], args=args)
+                count = bits[-1]
+            else:
+                pipe = server.pipeline(transaction=insert)
+                for index, offsets in entries:
+                    for offset in offsets:
+                        if insert:
+                            pipe.setbit(name, offset, 1)
+                        else:
+                            pipe.getbit(name, offset)
+                if insert and self.expire_at is not None:
+                    # in the same transaction, so a block is never created without its expiry
+                    pipe.expireat(name, self.expire_at)
+                bits = pipe.execute()
+            position = 0
+            for index, offsets in entries:
+                results[index] = all(bits[position:position + len(offsets)])
+                position += len(offsets)
+                if counter is not None and server is not self.server and not results[index]:
+                    uncounted += 1
+        if counter is None:
+            return results
+        if uncounted or count is None:
+            count = self.server.hincrby(counter[0], counter[1], uncounted)
+        return results, int(count)
+
+    def _locate_many(self, data_list):
+        """
+            Returns block number and bit offsets of each data.
+        """
+        digests = [self._compress_by_md5(data) for data in data_list]
         # cut the first two place,route to different block by block_num
-        name = self.key + str(int(data[0:2], 16) % self.block_num)
-        for h in self.hash_function:
-            local_hash = h.hash(data)
-            self.server.setbit(name, local_hash, 1)
+        blocks = [int(digest[0:2], 16) % self.block_num for digest in digests]
+        return zip(blocks, self.hash_function.hash_many(digests))
 
-    def _compress_by_md5(self, data):
-        md_5 = md5()
-        md_5.update(data)
-        return md_5.hexdigest()
+
+class ScalableRedisBloomFilter(BaseBloomFilter):
+    """
+        ScalableRedisBloomFilter class to implement bloom filter that grows with the inserted values.
+
+        It is a chain of RedisBloomFilter slices (Almeida et al. scalable bloom filter). New values
+        go into the last slice, when the last slice is filled up to its capacity a new slice with
+        growth times the capacity and tightening times the error rate is appended, so the compound
+        false positive rate stays under error_rate and memory is only allocated when needed.
+        The number of values inserted into each slice is kept in the redis hash "<key>:slices" and
+        shared by all the crawler nodes, it is counted by the script inserting the values.
+    """
+
+    def __init__(self, server, key, capacity, error_rate, block_num=1, growth=2, tightening=0.9, ring=None):
+        """
+            Parameters:
+            -----------
+            server
+                Redis client instance
+            key
+                Redis key name
+            capacity
+                capacity of the first slice
+            error_rate
+                the target false positive rate of whole filter
+            block_num
+                block number of each slice
+            growth
+                capacity ratio of a new slice to the previous one
+            tightening
+                error rate ratio of a new slice to the previous one
+            ring
+                HashRing of redis client instances to spread the blocks of slices over, the
+                count of slices is kept on server
+        """
+        self.server = server
+        self.key = key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.block_num = block_num
+        self.growth = growth
+        self.tightening = tightening
+        self.ring = ring
+        self.slices_key = key + ':slices'
+        self.slices = []
+        self._refresh()
+
+    def _slice_size(self, index):
+        """
+            Returns capacity, error rate and block number of slice index.
+
+            A slice whose blocks would pass the redis string limit gets more blocks, and once
+            it has MAX_BLOCK_NUM blocks its capacity stops growing.
+        """
+        capacity = self.capacity * self.growth ** index
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** index
+        block_num = self.block_num
+        while True:
+            bit_size = optimal_size(int(math.ceil(float(capacity) / block_num)), error_rate)[0]
+            if bit_size <= MAX_BIT_SIZE:
+                return capacity, error_rate, block_num
+            if block_num * 2 <= MAX_BLOCK_NUM:
+                block_num *= 2
+            else:
+                capacity = capacity * MAX_BIT_SIZE // bit_size
+
+    def _slice(self, index):
+        capacity, error_rate, block_num = self._slice_size(index)
+        return RedisBloomFilter.from_capacity(self.server, '%s:%d:' % (self.key, index),
+                                              capacity, error_rate, block_num, self.ring)
+
+    def _refresh(self):
+        """
+            Load the slices created by any node and the count of the last one.
+        """
+        self.server.hsetnx(self.slices_key, 0, 0)
+        count = self.server.hlen(self.slices_key)
+        while len(self.slices) < count:
+            self.slices.append(self._slice(len(self.slices)))
+        self.last_capacity = self._slice_size(count - 1)[0]
+        self.inserted = int(self.server.hget(self.slices_key, count - 1) or 0)
+
+    def _room(self):
+        """
+            Returns how many values the last slice can still take.
+        """
+        return self.last_capacity - self.inserted
+
+    def contains_many(self, data_list):
+        results = [False] * len(data_list)
+        self._check(self.slices, data_list, results, [i for i, data in enumerate(data_list) if data])
+        return results
+
+    def add_many(self, data_list):
+        """
+            Insert a batch of data into the last slice unless an older slice already has it.
+
+            The batch is split by the room left in the last slice, so a big batch can not
+            overfill a slice before the next one is appended.
+        """
+        results = [False] * len(data_list)
+        pending = [i for i, data in enumerate(data_list) if data]
+        checked = 0
+        while pending:
+            pending = self._check(self.slices[checked:-1], data_list, results, pending)
+            checked = len(self.slices) - 1
+            room = max(1, self._room())
+            chunk, pending = pending[:room], pending[room:]
+            if not chunk:
+                break
+            added, self.inserted = self.slices[-1].add_many_counted([data_list[i] for i in chunk],
+                                                                    self.slices_key, checked)
+            for i, result in zip(chunk, added):
+                results[i] = result
+            if self._room() <= 0:
+                self._grow(checked)
+        return results
+
+    def clear(self):
+        # Slices appended by other nodes since the last refresh are cleared too, else a new
+        # slice would reuse their bits.
+        self._refresh()
+        for bloomfilter in self.slices:
+            bloomfilter.clear()
+        self.server.delete(self.slices_key)
+        self.slices = []
+        self._refresh()
+
+    def _grow(self, index):
+        """
+            Append a new slice after the filled up slice index.
+        """
+        self.server.hsetnx(self.slices_key, index + 1, 0)
+        self._refresh()
+
+    def _check(self, slices, data_list, results, indexes):
+        """
+            Set results of the data found in any of slices, returns indexes still not found.
+
+            The GETBIT of all slices go in one pipelined round trip per redis node.
+        """
+        if not indexes or not slices:
+            return indexes
+        values = [data_list[i] for i in indexes]
+        found = found_in_any(((bloomfilter, position, block, offsets) for bloomfilter in slices
+                              for position, (block, offsets) in enumerate(bloomfilter._locate_many(values))),
+                             len(indexes))
+        for i, exist in zip(indexes, found):
+            results[i] = exist
+        return [i for i, exist in zip(indexes, found) if not exist]
+
+
+class LocalBloomFilter(BaseBloomFilter):
+    """
+        LocalBloomFilter class to implement bloom filter in the memory of current process.
+
+        The bits are kept in a bytearray, or in a memory mapped file when path is given so the
+        filter survives restarts of the process. The bit order inside each byte is the same as
+        the string of redis.
+    """
+
+    def __init__(self, bit_size, hash_num, path=None):
+        """
+            Parameters:
+            -----------
+            bit_size
+                bit number of the filter
+            hash_num
+                the number of hash function
+            path
+                file path to map the bits, default keep the bits in memory only
+        """
+        self.bit_size = bit_size
+        self.hash_num = hash_num
+        self.path = path
+        self.hash_function = DoubleHash(bit_size, hash_num)
+        size = (bit_size + 7) // 8
+        if path is None:
+            self._file = None
+            self.bits = bytearray(size)
+        else:
+            self._file = open(path, 'a+b')
+            if os.path.getsize(path) < size:
+                self._file.truncate(size)
+            self.bits = mmap.mmap(self._file.fileno(), size)
+
+    @classmethod
+    def from_capacity(cls, capacity, error_rate, path=None):
+        """
+            Returns a filter sized to hold capacity values with the false positive rate error_rate.
+        """
+        bit_size, hash_num = optimal_size(capacity, error_rate)
+        return cls(bit_size, hash_num, path=path)
+
+    def contains_many(self, data_list):
+        bits = self.bits
+        results = [False] * len(data_list)
+        for index, offsets in self._offsets_many(data_list):
+            results[index] = all(bits[offset >> 3] & (0x80 >> (offset & 7)) for offset in offsets)
+        return results
+
+    def add_many(self, data_list):
+        bits = self.bits
+        results = [False] * len(data_list)
+        for index, offsets in self._offsets_many(data_list):
+            exist = True
+            for offset in offsets:
+                mask = 0x80 >> (offset & 7)
+                if not bits[offset >> 3] & mask:
+                    exist = False
+                    bits[offset >> 3] |= mask
+            results[index] = exist
+        return results
+
+    def clear(self):
+        self.bits[:] = bytes(bytearray(len(self.bits)))
+
+    def close(self):
+        """
+            Flush and release the memory mapped file.
+        """
+        if self._file is not None:
+            self.bits.flush()
+            self.bits.close()
+            self._file.close()
+            self._file = None
+
+    def _offsets_many(self, data_list):
+        indexes = [index for index, data in enumerate(data_list) if data]
+        digests = [self._compress_by_md5(data_list[index]) for index in indexes]
+        return zip(indexes, self.hash_function.hash_many(digests))
+
+
+class TieredBloomFilter(BaseBloomFilter):
+    """
+        TieredBloomFilter class to put a local bloom filter in front of a shared one.
+
+        Values found in the local tier are answered without asking the remote tier, only the
+        values possibly new to this process go to redis, and every value the remote tier has
+        seen is copied to the local tier.
+    """
+
+    def __init__(self, local, remote):
+        """
+            Parameters:
+            -----------
+            local
+                LocalBloomFilter instance
+            remote
+                bloom filter instance shared by all nodes, like RedisBloomFilter
+        """
+        self.local = local
+        self.remote = remote
+
+    def contains_many(self, data_list):
+        return self._execute_many(data_list, insert=False)
+
+    def add_many(self, data_list):
+        return self._execute_many(data_list, insert=True)
+
+    def _execute_many(self, data_list, insert):
+        results = self.local.contains_many(data_list)
+        pending = [i for i, data in enumerate(data_list) if data and not results[i]]
+        if not pending:
+            return results
+        remote_many = self.remote.add_many if insert else self.remote.contains_many
+        for i, result in zip(pending, remote_many([data_list[i] for i in pending])):
+            results[i] = result
+        # all pending values are in redis after add, only the found ones after contains
+        self.local.add_many([data_list[i] for i in pending if insert or results[i]])
+        return results
+
+    def clear(self):
+        self.local.clear()
+        self.remote.clear()
+
+    def close(self):
+        self.local.close()
+        self.remote.close()
+
+
+class GenerationalBloomFilter(BaseBloomFilter):
+    """
+        GenerationalBloomFilter class to implement bloom filter that forgets data after some time.
+
+        The time is cut into windows of window seconds, each window writes into its own
+        generation of RedisBloomFilter, and a data is exist only if it was inserted in one of the
+        last generations windows. The key of each generation expires once it falls out of the
+        last generations windows, so the data will be crawled again on schedule without wiping
+        the whole filter. The expiry is set by every insert, in the transaction of its SETBIT.
+    """
+
+    def __init__(self, server, key, window, generations, block_num=1, bit_size=1 << 31, hash_num=9,
+                 ring=None):
+        """
+            Parameters:
+            -----------
+            server
+                Redis client instance
+            key
+                Redis key name
+            window
+                seconds covered by each generation
+            generations
+                the number of generations that data is remembered
+            block_num
+                block number of each generation
+            bit_size
+                bit number of each block
+            hash_num
+                the number of hash function
+            ring
+                HashRing of redis client instances to spread the blocks of generations over
+        """
+        if window <= 0 or generations <= 0:
+            raise ValueError("window and generations must be positive: %r, %r" % (window, generations))
+        self.server = server
+        self.key = key
+        self.window = window
+        self.generations = generations
+        self.block_num = block_num
+        self.bit_size = bit_size
+        self.hash_num = hash_num
+        self.ring = ring
+        self._filters = {}
+
+    @classmethod
+    def from_capacity(cls, server, key, window, generations, capacity, error_rate, block_num=1, ring=None):
+        """
+            Returns a filter whose each generation holds capacity values with the false positive
+            rate error_rate.
+        """
+        bit_size, hash_num = optimal_size(int(math.ceil(float(capacity) / block_num)), error_rate)
+        if bit_size > MAX_BIT_SIZE:
+            raise ValueError("capacity %d needs %d bits per block, more than the redis limit %d, "
+                             "use more blocks" % (capacity, bit_size, MAX_BIT_SIZE))
+        return cls(server, key, window, generations, block_num, bit_size, hash_num, ring)
+
+    def _generation(self, index):
+        if index not in self._filters:
+            self._filters[index] = RedisBloomFilter(self.server, '%s:g%d:' % (self.key, index),
+                                                    self.block_num, self.bit_size, self.hash_num, self.ring,
+                                                    expire_at=int((index + self.generations) * self.window))
+        return self._filters[index]
+
+    def _current(self):
+        """
+            Returns index of the current generation and drops the filters out of the windows.
+        """
+        current = int(time.time() // self.window)
+        for index in list(self._filters):
+            if index <= current - self.generations:
+                del self._filters[index]
+        return current
+
+    def contains_many(self, data_list):
+        current = self._current()
+        results = [False] * len(data_list)
+        self._check(range(current, current - self.generations, -1), data_list, results)
+        return results
+
+    def add_many(self, data_list):
+        """
+            Insert a batch of data into the current generation unless a previous one has it.
+        """
+        current = self._current()
+        results = [False] * len(data_list)
+        pending = self._check(range(current - 1, current - self.generations, -1), data_list, results)
+        if pending:
+            for i, result in zip(pending, self._generation(current).add_many([data_list[i] for i in pending])):
+                results[i] = result
+        return results
+
+    def clear(self):
+        servers = [self.server] if self.ring is None else self.ring.nodes.values()
+        for server in servers:
+            keys = list(server.scan_iter(match='%s:g*' % self.key))
+            if keys:
+                server.delete(*keys)
+        self._filters = {}
+
+    def _check(self, indexes, data_list, results):
+        """
+            Set results of the data found in any generation of indexes, returns positions of
+            data still not found.
+
+            All generations share the block and offsets of a data, their GETBIT go in one
+            pipelined round trip per redis node.
+        """
+        pending = [i for i, data in enumerate(data_list) if data]
+        filters = [self._generation(index) for index in indexes]
+        if not pending or not filters:
+            return pending
+        located = list(filters[0]._locate_many([data_list[i] for i in pending]))
+        found = found_in_any(((bloomfilter, position, block, offsets) for bloomfilter in filters
+                              for position, (block, offsets) in enumerate(located)), len(pending))
+        for i, exist in zip(pending, found):
+            results[i] = exist
+        return [i for i, exist in zip(pending, found) if not exist]
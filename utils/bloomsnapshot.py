@@ -0,0 +1,81 @@
+"""
+Export and import the bits of a RedisBloomFilter, to warm start a crawl on a new redis instance.
+
+Usage:
+
+    python -m utils.bloomsnapshot dump --url redis://localhost:6379 --key spider:dupefilter snapshot.gz
+    python -m utils.bloomsnapshot load --url redis://otherhost:6379 --key spider:dupefilter snapshot.gz
+
+The geometry of the filter (--capacity and --error-rate, or --bit-size and --hash-num, and
+--block-num) must be the one used by the crawler. It is stored in the snapshot, so load only
+needs the key.
+"""
+import argparse
+import gzip
+import struct
+import sys
+import time
+
+import redis
+
+from utils.bloomfilter import SNAPSHOT_HEADER, SNAPSHOT_MAGIC, RedisBloomFilter
+
+
+def read_header(path):
+    """
+        Returns (bit_size, hash_num, block_num) stored in the snapshot file.
+    """
+    with gzip.open(path, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError("not a bloomfilter snapshot: %s" % path)
+        return SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+
+
+def dump(server, args):
+    if args.capacity:
+        bloomfilter = RedisBloomFilter.from_capacity(server, args.key, args.capacity, args.error_rate,
+                                                     args.block_num)
+    else:
+        bloomfilter = RedisBloomFilter(server, args.key, args.block_num, args.bit_size, args.hash_num)
+    # the bitmaps are mostly random bits, a low level is nearly as small and much faster
+    with gzip.open(args.path, 'wb', compresslevel=args.level) as f:
+        return bloomfilter.dump(f, chunk_size=args.chunk_size, depth=args.depth)
+
+
+def load(server, args):
+    bit_size, hash_num, block_num = read_header(args.path)
+    bloomfilter = RedisBloomFilter(server, args.key, block_num, bit_size, hash_num)
+    with gzip.open(args.path, 'rb') as f:
+        return bloomfilter.load(f, depth=args.depth)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the bits of a RedisBloomFilter.")
+    parser.add_argument('command', choices=['dump', 'load'])
+    parser.add_argument('path', help="snapshot file, gzip compressed")
+    parser.add_argument('--url', default='redis://localhost:6379', help="redis url")
+    parser.add_argument('--key', required=True, help="key of the filter, like <spider>:dupefilter")
+    parser.add_argument('--block-num', type=int, default=1)
+    parser.add_argument('--bit-size', type=int, default=1 << 31)
+    parser.add_argument('--hash-num', type=int, default=9)
+    parser.add_argument('--capacity', type=int, help="size the filter like BLOOMFILTER_CAPACITY")
+    parser.add_argument('--error-rate', type=float, default=0.001)
+    parser.add_argument('--chunk-size', type=int, default=1 << 20, help="bytes of each GETRANGE")
+    parser.add_argument('--depth', type=int, default=16, help="commands of each pipelined round trip")
+    parser.add_argument('--level', type=int, default=1, help="gzip compress level of dump")
+    args = parser.parse_args(argv)
+
+    server = redis.StrictRedis.from_url(args.url)
+    start = time.time()
+    try:
+        size = dump(server, args) if args.command == 'dump' else load(server, args)
+    except (ValueError, struct.error) as e:
+        parser.error(str(e))
+    elapsed = time.time() - start
+    print("%s %d bytes of bitmap in %.2fs (%.1f MB/s)"
+          % (args.command, size, elapsed, size / 1048576.0 / max(elapsed, 1e-6)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
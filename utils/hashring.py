@@ -0,0 +1,53 @@
+import bisect
+from hashlib import md5
+
+
+class HashRing(object):
+    """
+        HashRing class to implement consistent hashing of keys to nodes.
+
+        Each node is put on the ring at replicas points, a key belongs to the first node point
+        after the hash of the key. Adding or removing a node only moves the keys of its points.
+    """
+
+    def __init__(self, nodes, replicas=160):
+        """
+            Parameters:
+            -----------
+            nodes: dict
+                node name to node object, the names place the nodes on the ring so they must be
+                the same in all processes, like the redis url.
+            replicas: integer
+                the number of points of each node.
+        """
+        if not nodes:
+            raise ValueError("nodes must not be empty")
+        self.nodes = dict(nodes)
+        self.replicas = replicas
+        self._points = []
+        self._names = []
+        for point, name in sorted((self._hash('%s#%d' % (name, i)), name)
+                                  for name in self.nodes for i in range(replicas)):
+            self._points.append(point)
+            self._names.append(name)
+
+    def _hash(self, key):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return int(md5(key).hexdigest()[:16], 16)
+
+    def get_name(self, key):
+        """
+            Returns name of the node that key belongs to.
+        """
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._names[index]
+
+    def get_node(self, key):
+        """
+            Returns the node that key belongs to.
+        """
+        return self.nodes[self.get_name(key)]
+
+    def __len__(self):
+        return len(self.nodes)
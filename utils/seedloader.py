@@ -0,0 +1,174 @@
+"""
+Load seed urls into the start urls key of a spider in large pipelined batches.
+
+Usage:
+
+    python -m utils.seedloader seeds.txt.gz --url redis://localhost:6379 --key myspider:start_urls
+    python -m utils.seedloader seeds.jsonl --key myspider:start_urls --type zset --score-field rank
+    cat seeds.txt | python -m utils.seedloader - --key myspider:start_urls --type set
+
+The input has one url per line, or one json object per line with the url in --url-field (jsonl),
+optionally gzip compressed, which are all detected from the content. --raw pushes the jsonl lines
+as they are, for spiders that decode json messages in make_request_from_data. A list keeps the
+order of the file, a set drops duplicates, a zset is popped by score (--score-field of jsonl, or
+--score). --bloom-key skips the urls the spider dupefilter has already seen, using the bloom
+filter settings of the scrapy project of the current directory.
+"""
+import argparse
+import gzip
+import io
+import json
+import sys
+import time
+
+import redis
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_input(path):
+    """
+        Returns the binary file of path, - for stdin, decompressed if it is gzipped.
+    """
+    if path == '-':
+        f = io.open(sys.stdin.fileno(), 'rb', closefd=False)
+    else:
+        f = io.open(path, 'rb')
+    if f.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=f)
+    return f
+
+
+def read_seeds(f, args):
+    """
+        Yields (message, score) of each seed of file f.
+    """
+    jsonl = None
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if jsonl is None:
+            jsonl = line.startswith(b'{')
+        if not jsonl:
+            yield line, args.score
+            continue
+        obj = json.loads(line.decode('utf-8'))
+        message = line if args.raw else obj[args.url_field].encode('utf-8')
+        yield message, float(obj.get(args.score_field, args.score))
+
+
+def make_prefilter(server, args):
+    """
+        Returns a function returning the new seeds of a batch, by the spider fingerprints.
+    """
+    from scrapy import Request
+    from scrapy.utils.misc import load_object
+    from scrapy.utils.project import get_project_settings
+    from scrapy.utils.request import request_fingerprint
+    from scrapy_redis.dupefilter import get_bloomfilter_from_settings
+
+    settings = get_project_settings()
+    if settings.getbool('BLOOMFILTER_LOCAL_ONLY'):
+        raise ValueError("the dupefilter of the project is not in redis")
+    bloomfilter = get_bloomfilter_from_settings(server, args.bloom_key, settings)
+    fingerprint = request_fingerprint
+    if settings.get('DUPEFILTER_FINGERPRINTER'):
+        fingerprint = load_object(settings['DUPEFILTER_FINGERPRINTER']).from_settings(settings).fingerprint
+
+    def prefilter(batch):
+        fps = []
+        for message, _ in batch:
+            url = message
+            if args.raw:
+                url = json.loads(message.decode('utf-8'))[args.url_field]
+            fps.append(fingerprint(Request(url.decode('utf-8') if isinstance(url, bytes) else url)))
+        return [seed for seed, seen in zip(batch, bloomfilter.contains_many(fps)) if not seen]
+    return prefilter
+
+
+def load(server, args, seeds, prefilter=None):
+    """
+        Pushes seeds to the key, returns (pushed, skipped).
+    """
+    pushed = skipped = 0
+    pipe = server.pipeline(transaction=False)
+    commands = 0
+    batch = []
+
+    def push(batch):
+        if args.type == 'list':
+            pipe.rpush(args.key, *[message for message, _ in batch])
+        elif args.type == 'set':
+            pipe.sadd(args.key, *[message for message, _ in batch])
+        else:
+            members = []
+            for message, score in batch:
+                members.extend((score, message))
+            pipe.execute_command('ZADD', args.key, *members)
+
+    def send():
+        # wake up the spiders waiting on an empty key, see REDIS_START_URLS_NOTIFY
+        pipe.publish('%s:notify' % args.key, 1)
+        pipe.execute()
+
+    for seed in seeds:
+        batch.append(seed)
+        if len(batch) < args.batch_size:
+            continue
+        if prefilter is not None:
+            new = prefilter(batch)
+            skipped += len(batch) - len(new)
+            batch = new
+        if batch:
+            push(batch)
+            pushed += len(batch)
+            commands += 1
+        batch = []
+        if commands >= args.depth:
+            send()
+            commands = 0
+    if batch and prefilter is not None:
+        new = prefilter(batch)
+        skipped += len(batch) - len(new)
+        batch = new
+    if batch:
+        push(batch)
+        pushed += len(batch)
+    send()
+    return pushed, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load seed urls into a start urls key.")
+    parser.add_argument('path', help="url file, plain or jsonl, optionally gzip compressed, - for stdin")
+    parser.add_argument('--url', default='redis://localhost:6379', help="redis url")
+    parser.add_argument('--key', required=True, help="start urls key, like <spider>:start_urls")
+    parser.add_argument('--type', choices=['list', 'set', 'zset'], default='list',
+                        help="list, set (REDIS_START_URLS_AS_SET) or zset")
+    parser.add_argument('--url-field', default='url', help="url field of jsonl objects")
+    parser.add_argument('--score-field', default='score', help="score field of jsonl objects for a zset")
+    parser.add_argument('--score', type=float, default=0, help="score of the seeds without one")
+    parser.add_argument('--raw', action='store_true', help="push jsonl lines instead of their url")
+    parser.add_argument('--bloom-key', help="skip the seeds seen by this dupefilter, like <spider>:dupefilter")
+    parser.add_argument('--batch-size', type=int, default=10000, help="seeds of each command")
+    parser.add_argument('--depth', type=int, default=10, help="commands of each pipelined round trip")
+    args = parser.parse_args(argv)
+
+    server = redis.StrictRedis.from_url(args.url)
+    start = time.time()
+    try:
+        prefilter = make_prefilter(server, args) if args.bloom_key else None
+        f = open_input(args.path)
+        pushed, skipped = load(server, args, read_seeds(f, args), prefilter)
+    except (IOError, ValueError, KeyError) as e:
+        parser.error(str(e))
+    elapsed = time.time() - start
+    print("pushed %d seeds to %s %s, skipped %d seen, in %.2fs (%.0f seeds/s)"
+          % (pushed, args.type, args.key, skipped, elapsed, (pushed + skipped) / max(elapsed, 1e-6)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())